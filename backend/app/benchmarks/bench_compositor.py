@@ -0,0 +1,88 @@
+# Compares the ffmpeg and MoviePy compositors on synthetic clips.
+#
+#   cd backend/app && python -m benchmarks.bench_compositor --duration 10 --preset balanced
+#
+# Each backend runs in a fresh subprocess so peak RSS (including the ffmpeg
+# children it spawns) is measured in isolation.
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+
+import ffmpeg # type: ignore
+
+FPS = 30
+
+
+def make_clips(directory: str, duration: float):
+    # Upper: silent Manim-like animation. Lower: avatar-like clip with narration audio,
+    # a different width and a shorter duration so scaling and alignment are exercised.
+    upper = os.path.join(directory, "upper.mp4")
+    lower = os.path.join(directory, "lower.mp4")
+    (
+        ffmpeg
+        .input(f"testsrc=size=1280x720:rate={FPS}:duration={duration}", f="lavfi")
+        .output(upper, vcodec="libx264", pix_fmt="yuv420p")
+        .run(overwrite_output=True, quiet=True)
+    )
+    video = ffmpeg.input(f"testsrc2=size=512x512:rate={FPS}:duration={duration * 0.8}", f="lavfi")
+    audio = ffmpeg.input(f"sine=frequency=440:duration={duration * 0.8}", f="lavfi")
+    (
+        ffmpeg
+        .output(video, audio, lower, vcodec="libx264", pix_fmt="yuv420p", acodec="aac")
+        .run(overwrite_output=True, quiet=True)
+    )
+    return upper, lower
+
+
+def run_backend(backend: str, upper: str, lower: str, output: str, preset: str):
+    from ml.compositor import BACKENDS
+
+    start = time.perf_counter()
+    BACKENDS[backend](upper, lower, output, preset=preset)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux; take whichever of us or the ffmpeg child peaked higher.
+    peak_kib = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    print(json.dumps({"elapsed": elapsed, "peak_rss_mb": peak_kib / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--preset", default="balanced")
+    parser.add_argument("--backends", nargs="+", default=["ffmpeg", "moviepy"])
+    parser.add_argument("--run", nargs=4, metavar=("BACKEND", "UPPER", "LOWER", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_backend(*args.run, preset=args.preset)
+        return
+
+    frames = int(args.duration * FPS)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        upper, lower = make_clips(directory, args.duration)
+        for backend in args.backends:
+            output = os.path.join(directory, f"out_{backend}.mp4")
+            proc = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_compositor", "--preset", args.preset,
+                 "--run", backend, upper, lower, output],
+                capture_output=True, text=True, check=True,
+            )
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            result["fps"] = frames / result["elapsed"]
+            results[backend] = result
+            print(f"{backend:>8}: {result['fps']:7.1f} frames/s  {result['elapsed']:6.2f}s  peak RSS {result['peak_rss_mb']:7.1f} MB")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+# Offline load test: drives every API route against local stand-ins for OpenAI, ElevenLabs,
+# the avatar/Manim endpoints and MongoDB, and reports throughput and latency per route.
+# Run from backend/app:
+#
+#   python -m benchmarks.bench_load --concurrency 16 --requests 200 --output load.json
+#   python -m benchmarks.bench_load --baseline load.json   # exits 1 on regression
+#
+# MongoDB: pass --mongo-uri for an existing server (a throwaway database is created and
+# dropped), otherwise a temporary mongod is started if one is on the PATH.
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx  # type: ignore
+
+from benchmarks.fakes import FakeConfig, FakeServices
+
+USER_ID = "bench-user"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_mongod(directory: str) -> tuple:
+    if shutil.which("mongod") is None:
+        sys.exit("No --mongo-uri given and no mongod on the PATH")
+    port = free_port()
+    dbpath = os.path.join(directory, "mongo")
+    os.makedirs(dbpath)
+    process = subprocess.Popen(
+        ["mongod", "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return process, f"mongodb://127.0.0.1:{port}"
+
+
+def percentile(values: List[float], q: float) -> float:
+    # Nearest-rank percentile of already sorted values.
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+# ---------------------------
+# Routes
+# ---------------------------
+class Route:
+    # One benchmarked endpoint: `build(i, state)` returns the keyword arguments for client.request.
+    def __init__(self, name: str, method: str, build: Callable[[int, dict], Dict[str, Any]], stream: bool = False):
+        self.name = name
+        self.method = method
+        self.build = build
+        self.stream = stream  # read the whole body (SSE, video) before stopping the clock
+
+
+def routes(args) -> List[Route]:
+    unique = (lambda i: f" #{i}") if not args.repeat_inputs else (lambda i: "")
+    document = "\n\n".join(f"Paragraph {n}. " + "lorem ipsum dolor sit amet " * 20 for n in range(args.document_kb * 2))
+    headers = {"user-id": USER_ID}
+    return [
+        Route("POST /generate", "POST", lambda i, s: {"url": "/generate", "json": {"user_input": f"Explain NodeJS{unique(i)}", "userId": USER_ID}}),
+        Route("POST /documents", "POST", lambda i, s: {"url": "/documents", "headers": {**headers, "content-type": "text/plain"},
+                                                      "content": (document + unique(i)).encode()}),
+        Route("GET /generate", "GET", lambda i, s: {"url": "/generate", "headers": headers}),
+        Route("GET /dashboard", "GET", lambda i, s: {"url": "/dashboard", "headers": headers}),
+        Route("GET /generated_topics/{topic_id}", "GET", lambda i, s: {"url": f"/generated_topics/{s['topic_id']}"}),
+        Route("POST /quizzes", "POST", lambda i, s: {"url": "/quizzes", "json": {"topic_id": s["topic_id"], "question_data": [f"Event loop{unique(i)}"]}}),
+        Route("POST /quizzes/stream", "POST", lambda i, s: {"url": "/quizzes/stream", "json": {"topic_id": s["topic_id"], "question_data": [f"Streams{unique(i)}"]}}, stream=True),
+        Route("GET /quizzes/{topic_id}", "GET", lambda i, s: {"url": f"/quizzes/{s['topic_id']}"}),
+        Route("POST /submit-score", "POST", lambda i, s: {"url": "/submit-score", "json": {"userId": f"{USER_ID}-{i % 100}", "points": i % 10}}),
+        Route("GET /get-score", "GET", lambda i, s: {"url": "/get-score", "headers": headers}),
+        Route("GET /leaderboard", "GET", lambda i, s: {"url": "/leaderboard"}),
+        Route("GET /leaderboard/rank", "GET", lambda i, s: {"url": "/leaderboard/rank", "headers": headers}),
+        Route("POST /roadmaps", "POST", lambda i, s: {"url": "/roadmaps", "json": {"topic_id": s["topic_id"], "user_input": [f"Backend{unique(i)}"]}}),
+        Route("POST /roadmaps/stream", "POST", lambda i, s: {"url": "/roadmaps/stream", "json": {"topic_id": s["topic_id"], "user_input": [f"Frontend{unique(i)}"]}}, stream=True),
+        Route("GET /roadmaps", "GET", lambda i, s: {"url": "/roadmaps", "params": {"topic_id": s["topic_id"]}}),
+        Route("GET /metrics", "GET", lambda i, s: {"url": "/metrics"}),
+        Route("GET /videos/{job_id}", "GET", lambda i, s: {"url": f"/videos/{s['job_id']}"}),
+        Route("GET /videos/{job_id}/stream", "GET", lambda i, s: {"url": f"/videos/{s['job_id']}/stream"}, stream=True),
+        Route("GET /videos/{job_id}/hls/index.m3u8", "GET", lambda i, s: {"url": f"/videos/{s['job_id']}/hls/index.m3u8"}),
+        # Last: each distinct prompt queues a render that keeps the workers busy afterwards.
+        Route("POST /videos", "POST", lambda i, s: {"url": "/videos", "json": {"topic_prompt": f"Bench topic {i % args.video_prompts}"}}),
+    ]
+
+
+async def setup(client: httpx.AsyncClient, args) -> dict:
+    # Data the read routes need: a topic with quizzes/roadmaps, a score, and one finished reel.
+    response = await client.post("/generate", json={"user_input": "Explain NodeJS", "userId": USER_ID})
+    response.raise_for_status()
+    state = {"topic_id": response.json()["topic_id"]}
+    await client.post("/quizzes", json={"topic_id": state["topic_id"], "question_data": ["Event loop"]})
+    await client.post("/roadmaps", json={"topic_id": state["topic_id"], "user_input": ["Backend"]})
+    await client.post("/submit-score", json={"userId": USER_ID, "points": 10})
+
+    response = await client.post("/videos", json={"topic_prompt": "Bench setup reel", "segmented": True})
+    response.raise_for_status()
+    state["job_id"] = response.json()["job_id"]
+    deadline = time.monotonic() + args.video_timeout
+    status = None
+    while time.monotonic() < deadline:
+        status = (await client.get(f"/videos/{state['job_id']}")).json().get("status")
+        if status in ("done", "error"):
+            break
+        await asyncio.sleep(0.5)
+    state["video_status"] = status
+    if status != "done":
+        print(f"Setup reel ended as {status!r}; video read routes will report errors")
+    return state
+
+# ---------------------------
+# Load generation
+# ---------------------------
+async def run_route(client: httpx.AsyncClient, route: Route, state: dict, total: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(total))
+
+    async def one(i: int):
+        kwargs = route.build(i, state)
+        start = time.perf_counter()
+        try:
+            if route.stream:
+                async with client.stream(route.method, **kwargs) as response:
+                    async for _ in response.aiter_bytes():
+                        pass
+            else:
+                response = await client.request(route.method, **kwargs)
+            status = str(response.status_code)
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    async def worker():
+        for i in counter:
+            await one(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 400)
+    return {
+        "requests": total,
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": total / elapsed,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+async def drive(base_url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        state = await setup(client, args)
+        results = {}
+        for route in routes(args):
+            if args.routes and not any(pattern in route.name for pattern in args.routes):
+                continue
+            result = await run_route(client, route, state, args.requests, args.concurrency)
+            results[route.name] = result
+            print(f"{route.name:>38}: {result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:8.1f}  "
+                  f"p95 {result['p95_ms']:8.1f}  p99 {result['p99_ms']:8.1f} ms  errors {result['errors']}")
+        return results
+
+
+def wait_until_up(base_url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"API server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/metrics", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit("API server did not start in time")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("routes", {}).get(name)
+        if old is None:
+            continue
+        # Small absolute noise floor so millisecond routes don't flap.
+        if result["p95_ms"] > old["p95_ms"] * (1 + tolerance) + 5:
+            regressions.append(f"{name} p95_ms: {old['p95_ms']:.1f} -> {result['p95_ms']:.1f}")
+        if result["throughput_rps"] < old["throughput_rps"] / (1 + tolerance):
+            regressions.append(f"{name} throughput_rps: {old['throughput_rps']:.1f} -> {result['throughput_rps']:.1f}")
+        if result["errors"] > old["errors"]:
+            regressions.append(f"{name} errors: {old['errors']} -> {result['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50, help="requests per route")
+    parser.add_argument("--routes", nargs="*", help="only routes whose name contains one of these")
+    parser.add_argument("--repeat-inputs", action="store_true", help="reuse inputs so LLM calls hit the cache")
+    parser.add_argument("--document-kb", type=int, default=32, help="approximate size of the /documents body")
+    parser.add_argument("--video-prompts", type=int, default=2, help="distinct reels queued by POST /videos")
+    parser.add_argument("--video-timeout", type=float, default=300, help="wait for the setup reel to render")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request client timeout")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--mongo-uri", help="existing MongoDB; default starts a temporary mongod")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.01)
+    parser.add_argument("--llm-padding", type=int, default=0, help="extra characters per generated item")
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--render-latency", type=float, default=2.0)
+    parser.add_argument("--media-seconds", type=float, default=3.0, help="length of fake narration and clips")
+    parser.add_argument("--payload-kb", type=int, default=256, help="media size when ffmpeg is unavailable")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown before failing")
+    args = parser.parse_args()
+
+    config = FakeConfig(
+        llm_latency=args.llm_latency, llm_chunk_delay=args.llm_chunk_delay, llm_padding=args.llm_padding,
+        tts_latency=args.tts_latency, audio_seconds=args.media_seconds,
+        render_latency=args.render_latency, video_seconds=args.media_seconds, payload_kb=args.payload_kb,
+    )
+    database = f"bench_{int(time.time())}"
+    mongod: Optional[subprocess.Popen] = None
+    server: Optional[subprocess.Popen] = None
+
+    with tempfile.TemporaryDirectory() as directory:
+        fakes = FakeServices(config, directory).start()
+        try:
+            mongo_uri = args.mongo_uri
+            if mongo_uri is None:
+                mongod, mongo_uri = start_mongod(directory)
+            port = free_port()
+            env = dict(
+                os.environ,
+                **fakes.env(),
+                MONGO_URI=mongo_uri,
+                MONGO_DB=database,
+                MONGO_TLS="1" if mongo_uri.startswith("mongodb+srv") else "0",
+                TTS_CACHE_DIR=os.path.join(directory, "tts_cache"),
+                HLS_ROOT=os.path.join(directory, "hls"),
+                REEL_OUTPUT_DIR=os.path.join(directory, "reels"),
+                REEL_CACHE_DIR=os.path.join(directory, "reel_cache"),
+                SCRATCH_ROOT=os.path.join(directory, "scratch"),
+            )
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "index:app", "--port", str(port),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                env=env,
+            )
+            base_url = f"http://127.0.0.1:{port}"
+            wait_until_up(base_url, server)
+            results = asyncio.run(drive(base_url, args))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(30)
+            if args.mongo_uri and mongo_uri:
+                from pymongo import MongoClient  # type: ignore
+                MongoClient(mongo_uri).drop_database(database)
+            if mongod is not None:
+                mongod.terminate()
+                mongod.wait(30)
+            fakes.stop()
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "upstream_requests": fakes.requests_served(),
+        "routes": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
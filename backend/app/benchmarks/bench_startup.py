@@ -0,0 +1,98 @@
+# Cold-start import cost per module: wall time and resident memory added by importing it
+# into a fresh interpreter. Run from backend/app so the app's modules resolve:
+#
+#   python -m benchmarks.bench_startup --output startup.json
+#   python -m benchmarks.bench_startup --baseline startup.json   # exits 1 on regression
+import sys
+import json
+import argparse
+import subprocess
+
+# What an API worker loads (index) vs. what only video workers should load.
+MODULES = [
+    "index",
+    "db.database",
+    "db.crud",
+    "crud.functions",
+    "ml.video_queue",
+    "ml.generate_video",
+    "fastapi",
+    "beanie",
+    "openai",
+    "moviepy",
+    "elevenlabs.client",
+    "ffmpeg",
+    "requests",
+]
+
+PROBE = """
+import sys, time, json, importlib
+sys.path.insert(0, ".")
+
+def rss_kib():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    import resource
+    return pages * resource.getpagesize() // 1024
+
+before = rss_kib()
+start = time.perf_counter()
+error = None
+try:
+    importlib.import_module(sys.argv[1])
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+elapsed = time.perf_counter() - start
+heavy = [m for m in ("moviepy", "elevenlabs", "ffmpeg", "numpy", "imageio") if m in sys.modules]
+print(json.dumps({"import_ms": elapsed * 1000, "rss_mb": (rss_kib() - before) / 1024, "heavy_modules": heavy, "error": error}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", PROBE, module], capture_output=True, text=True)
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda r: r["import_ms"])  # least noisy of the cold starts
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown before failing")
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        results[module] = result
+        status = result["error"] or ", ".join(result["heavy_modules"]) or "-"
+        print(f"{module:>20}: {result['import_ms']:8.1f} ms  {result['rss_mb']:7.1f} MB  heavy: {status}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = []
+        for module, result in results.items():
+            old = baseline.get(module)
+            if old is None or result["error"] or old["error"]:
+                continue
+            for metric in ("import_ms", "rss_mb"):
+                # Small absolute noise floor so sub-millisecond modules don't flap.
+                if result[metric] > old[metric] * (1 + args.tolerance) + 5:
+                    regressions.append(f"{module} {metric}: {old[metric]:.1f} -> {result[metric]:.1f}")
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
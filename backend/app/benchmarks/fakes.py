@@ -0,0 +1,210 @@
+# Local stand-ins for the external services the app calls, for offline benchmarks:
+# an OpenAI-compatible chat completions API, ElevenLabs text-to-speech, and the
+# avatar/Manim render endpoints. Latency and payload sizes are configurable.
+import os
+import json
+import time
+import random
+import string
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+class FakeConfig:
+    def __init__(self, llm_latency: float = 0.5, llm_chunk_delay: float = 0.01, llm_padding: int = 0,
+                 tts_latency: float = 0.3, audio_seconds: float = 3.0,
+                 render_latency: float = 2.0, video_seconds: float = 3.0, payload_kb: int = 256):
+        self.llm_latency = llm_latency  # before the first byte of a completion
+        self.llm_chunk_delay = llm_chunk_delay  # between streamed deltas
+        self.llm_padding = llm_padding  # extra characters per generated item
+        self.tts_latency = tts_latency
+        self.audio_seconds = audio_seconds
+        self.render_latency = render_latency
+        self.video_seconds = video_seconds
+        self.payload_kb = payload_kb  # size of media payloads when ffmpeg can't make real ones
+
+# ---------------------------
+# Canned model output, shaped like what each prompt in crud/functions.py asks for
+# ---------------------------
+def _filler(size: int) -> str:
+    return "".join(random.choices(string.ascii_lowercase + " ", k=size))
+
+
+def fake_completion(prompt: str, padding: int = 0) -> str:
+    if prompt.startswith("Summarize"):
+        return "Summary: " + _filler(200 + padding)
+    if "'difficult', 'medium', and 'easy'" in prompt:
+        topics = {level: [f"{level} topic {i}" for i in range(5)] for level in ("difficult", "medium", "easy")}
+        return json.dumps(topics)
+    if "quiz questions" in prompt:
+        questions = [{
+            "id": i,
+            "text": f"Question {i}? {_filler(padding)}".strip(),
+            "options": [{"id": option, "text": f"Option {option}", "correct": option == "B"} for option in "ABCD"],
+        } for i in range(1, 6)]
+        return json.dumps(questions)
+    if "roadmap" in prompt:
+        roadmap = {"roadmap": {f"Section {i}": {f"Part {j}": [f"Step {k} {_filler(padding)}".strip() for k in range(3)]
+                                                for j in range(2)} for i in range(4)}}
+        return json.dumps(roadmap)
+    return _filler(100 + padding)
+
+# ---------------------------
+# Media payloads
+# ---------------------------
+def make_media(directory: str, config: FakeConfig) -> Dict[str, bytes]:
+    # Real MP3/MP4 files so the render pipeline can decode them; random bytes if ffmpeg is missing.
+    try:
+        import ffmpeg # type: ignore
+        audio = os.path.join(directory, "fake_tts.mp3")
+        video = os.path.join(directory, "fake_render.mp4")
+        (
+            ffmpeg
+            .input(f"sine=frequency=220:duration={config.audio_seconds}", f="lavfi")
+            .output(audio, acodec="libmp3lame")
+            .run(overwrite_output=True, quiet=True)
+        )
+        (
+            ffmpeg
+            .output(
+                ffmpeg.input(f"testsrc=size=512x512:rate=25:duration={config.video_seconds}", f="lavfi"),
+                ffmpeg.input(f"sine=frequency=440:duration={config.video_seconds}", f="lavfi"),
+                video, vcodec="libx264", preset="ultrafast", pix_fmt="yuv420p", acodec="aac",
+            )
+            .run(overwrite_output=True, quiet=True)
+        )
+        with open(audio, "rb") as f, open(video, "rb") as g:
+            return {"audio": f.read(), "video": g.read()}
+    except Exception as e:
+        print(f"Could not generate media with ffmpeg ({e}); serving random bytes, so video routes will fail")
+        payload = os.urandom(config.payload_kb * 1024)
+        return {"audio": payload, "video": payload}
+
+# ---------------------------
+# HTTP handlers
+# ---------------------------
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    config: FakeConfig
+    media: Dict[str, bytes]
+    requests_served = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        type(self).requests_served += 1
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class OpenAIHandler(_Handler):
+    def do_POST(self):
+        request = json.loads(self._read_body() or b"{}")
+        prompt = request["messages"][-1]["content"]
+        content = fake_completion(prompt, self.config.llm_padding)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request.get("model", "fake")}
+        time.sleep(self.config.llm_latency)
+
+        if not request.get("stream"):
+            body = dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"},
+            ])
+            self._send(200, json.dumps(body).encode(), "application/json")
+            return
+
+        type(self).requests_served += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(data: str):
+            payload = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+
+        for i in range(0, len(content), 16):
+            chunk = dict(base, object="chat.completion.chunk", choices=[
+                {"index": 0, "delta": {"content": content[i:i + 16]}, "finish_reason": None},
+            ])
+            event(json.dumps(chunk))
+            time.sleep(self.config.llm_chunk_delay)
+        event(json.dumps(dict(base, object="chat.completion.chunk", choices=[], usage=usage)))
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class TTSHandler(_Handler):
+    def do_POST(self):
+        self._read_body()
+        time.sleep(self.config.tts_latency)
+        self._send(200, self.media["audio"], "audio/mpeg")
+
+
+class RenderHandler(_Handler):
+    # Serves both the avatar and the Manim endpoint: drain the upload, wait, return a clip.
+    def do_POST(self):
+        self._read_body()
+        time.sleep(self.config.render_latency)
+        self._send(200, self.media["video"], "video/mp4")
+
+# ---------------------------
+# Lifecycle
+# ---------------------------
+class FakeServices:
+    def __init__(self, config: FakeConfig, directory: str, host: str = "127.0.0.1"):
+        self.config = config
+        self.host = host
+        self.media = make_media(directory, config)
+        self._servers: Dict[str, ThreadingHTTPServer] = {}
+        self._threads: List[threading.Thread] = []
+
+    def _serve(self, name: str, handler: type):
+        handler = type(handler.__name__, (handler,), {"config": self.config, "media": self.media, "requests_served": 0})
+        server = ThreadingHTTPServer((self.host, 0), handler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self._servers[name] = server
+        self._threads.append(thread)
+
+    def url(self, name: str, path: str = "") -> str:
+        return f"http://{self.host}:{self._servers[name].server_address[1]}{path}"
+
+    def start(self) -> "FakeServices":
+        self._serve("openai", OpenAIHandler)
+        self._serve("elevenlabs", TTSHandler)
+        self._serve("avatar", RenderHandler)
+        self._serve("manim", RenderHandler)
+        return self
+
+    def env(self) -> Dict[str, str]:
+        # Environment that points the app at these servers instead of the real services.
+        return {
+            "OPENAI_BASE_URL": self.url("openai", "/v1"),
+            "OPENAI_API_KEY": "fake",
+            "ELEVENLABS_BASE_URL": self.url("elevenlabs"),
+            "ELEVENLABS_API_KEY": "fake",
+            "AVATAR_URL": self.url("avatar", "/predict"),
+            "MANIM_URL": self.url("manim", "/generate_manim"),
+        }
+
+    def requests_served(self) -> Dict[str, int]:
+        return {name: server.RequestHandlerClass.requests_served for name, server in self._servers.items()}
+
+    def stop(self, timeout: Optional[float] = 5):
+        for server in self._servers.values():
+            server.shutdown()
+            server.server_close()
+        for thread in self._threads:
+            thread.join(timeout)
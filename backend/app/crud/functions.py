@@ -1,24 +1,25 @@
 import json
-import os
-from openai import OpenAI  # type: ignore
-from moviepy import *  # type: ignore
 from pydantic import BaseModel  # type: ignore
-from typing import List  # type: ignore
+from typing import Any, AsyncIterator, List, Tuple  # type: ignore
 from dotenv import load_dotenv  # type: ignore
-from db.crud import create_generated_topics, create_topic, create_quiz, create_roadmap, get_topic
+from db.crud import create_topic_with_generated_topics, create_quiz, create_roadmap, get_topic, save_quiz, save_roadmap
+from crud.llm_client import complete, complete_stream
+from crud.llm_cache import cached_generation, lookup_generation, store_generation
+from crud.json_stream import IncrementalJSONParser, assemble
+from crud.ingest import summarize_long_text
 
 load_dotenv("/backend/app/.env")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
+
+# Bump when a prompt changes so cached generations from the old prompt are not reused.
+SUMMARY_PROMPT_VERSION = "1"
+TOPICS_PROMPT_VERSION = "1"
+QUIZ_PROMPT_VERSION = "1"
+ROADMAP_PROMPT_VERSION = "1"
 
 
 async def summarize_text(text: str) -> str:
     prompt = f"Summarize the following text in brief, keeping only the essential details: {text}"
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return response.choices[0].message.content.strip()
+    return await cached_generation("summary", SUMMARY_PROMPT_VERSION, text, lambda: complete(prompt))
 
 
 async def generate_topics(user_input: str, userId: str) -> str:
@@ -26,28 +27,27 @@ async def generate_topics(user_input: str, userId: str) -> str:
     
     if len(user_input) > MAX_LENGTH:
         print("Input is too long, summarizing first...")
-        user_input = await summarize_text(user_input)
+        user_input = await summarize_long_text(user_input)
     
     prompt = (
         f"Generate a JSON object with keys 'difficult', 'medium', and 'easy', each containing an array of 5 topics, "
         f"related to: {user_input}. Return only valid JSON."
     )
     
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    
-    try:
-        topics = json.loads(response.choices[0].message.content.strip())  # Parse response as JSON
-    except json.JSONDecodeError:
-        print("Error parsing response as JSON")
+    async def ask():
+        try:
+            return json.loads(await complete(prompt))  # Parse response as JSON
+        except json.JSONDecodeError:
+            print("Error parsing response as JSON")
+            return {}
+
+    topics = await cached_generation("topics", TOPICS_PROMPT_VERSION, user_input, ask)
+    if not topics:
         return "{}"
     
-    topic_id = await create_topic(user_input, userId)  # Get the MongoDB _id
-
-    await create_generated_topics(
-        topic_id=str(topic_id),  # Convert _id to string if needed
+    topic_id = await create_topic_with_generated_topics(
+        user_input,
+        userId,
         difficulty=topics.get("difficult", []),
         medium=topics.get("medium", []),
         easy=topics.get("easy", [])
@@ -58,7 +58,7 @@ async def generate_topics(user_input: str, userId: str) -> str:
     return {"topic_id": str(topic_id)}
 
 
-async def generate_quiz(topic_id: str, question: List[str]) -> dict:
+def quiz_prompt(question: List[str]) -> str:
     question_format = {
         "id": 1,
         "text": "What is the capital of France?",
@@ -70,27 +70,30 @@ async def generate_quiz(topic_id: str, question: List[str]) -> dict:
         ],
     }
     
-    prompt = f"Generate a JSON array of 5 quiz questions on the topics: {question}. Each question should follow this format: {json.dumps(question_format)}"
+    return f"Generate a JSON array of 5 quiz questions on the topics: {question}. Each question should follow this format: {json.dumps(question_format)}"
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}]
-    )
 
-    quiz_text = response.choices[0].message.content.strip()
+async def generate_quiz(topic_id: str, question: List[str]) -> dict:
+    prompt = quiz_prompt(question)
 
-    try:
-        quiz_json = json.loads(quiz_text)
-    except json.JSONDecodeError:
-        print("Invalid JSON response received")
+    async def ask():
+        try:
+            return json.loads(await complete(prompt))
+        except json.JSONDecodeError:
+            print("Invalid JSON response received")
+            return {}
+
+    quiz_json = await cached_generation("quiz", QUIZ_PROMPT_VERSION, question, ask)
+    if not quiz_json:
         return {}
 
+    await save_quiz(topic_id, json.dumps(quiz_json))
     print("Quiz generated.")
     return quiz_json
 
 
 
-async def generate_roadmap(topic_id: str, user_input: List[str]) -> dict:
+def roadmap_prompt(user_input: List[str]) -> str:
     question_format = {
         "webDevelopmentRoadmap": {
             "Frontend": {
@@ -121,27 +124,84 @@ async def generate_roadmap(topic_id: str, user_input: List[str]) -> dict:
         }
     }
 
-    prompt = (
+    return (
         f"Generate a JSON object with a roadmap for the following topic: {json.dumps(user_input)}. "
         f"The roadmap should be in a hierarchical format where every parent node has child nodes, "
         f"and each child node has sub-child nodes. The output must strictly follow this structure: "
         f"{json.dumps(question_format, indent=2)}"
     )
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}]
-    )
 
-    roadmap_code = response.choices[0].message.content.strip()
+async def generate_roadmap(topic_id: str, user_input: List[str]) -> dict:
+    prompt = roadmap_prompt(user_input)
 
-    try:
-        roadmap_json = json.loads(roadmap_code)  # Convert response to JSON
-    except json.JSONDecodeError:
-        print("Error decoding roadmap JSON. Returning empty structure.")
-        roadmap_json = {}
+    async def ask():
+        try:
+            return json.loads(await complete(prompt))  # Convert response to JSON
+        except json.JSONDecodeError:
+            print("Error decoding roadmap JSON. Returning empty structure.")
+            return {}
+
+    roadmap_json = await cached_generation("roadmap", ROADMAP_PROMPT_VERSION, user_input, ask)
+    if roadmap_json:
+        await save_roadmap(topic_id, json.dumps(roadmap_json))
 
     print("Roadmap generated.")
 
     return roadmap_json
 
+
+async def stream_generation(kind: str, version: str, user_input: Any, prompt: str,
+                            emit_depth: int) -> AsyncIterator[Tuple[str, Any]]:
+    # Yields ("item", (path, value)) for each element as soon as it parses, then ("done", result),
+    # with an ("error", ...) before "done" if the model stream failed.
+    # If the output breaks off, the result is rebuilt from the elements that did arrive.
+    cached = await lookup_generation(kind, version, user_input)
+    if cached:
+        parser = IncrementalJSONParser(emit_depth)
+        for item in parser.feed(json.dumps(cached)):
+            yield "item", item
+        yield "done", {"result": cached, "partial": False}
+        return
+
+    parser = IncrementalJSONParser(emit_depth)
+    items = []
+    try:
+        async for delta in complete_stream(prompt):
+            for item in parser.feed(delta):
+                items.append(item)
+                yield "item", item
+    except Exception as e:
+        print(f"{kind} stream broke off: {e}")
+        yield "error", {"message": str(e)}
+
+    result = parser.result()
+    if result:
+        await store_generation(kind, version, user_input, result)
+        yield "done", {"result": result, "partial": False}
+    else:
+        yield "done", {"result": assemble(items, parser.root or "["), "partial": True}
+
+
+async def stream_quiz(topic_id: str, question: List[str]) -> AsyncIterator[Tuple[str, Any]]:
+    async for event, data in stream_generation("quiz", QUIZ_PROMPT_VERSION, question, quiz_prompt(question), emit_depth=1):
+        if event == "item":
+            yield "question", data[1]
+        else:
+            # A partial result goes to this client only; storing it would serve it as complete later.
+            if event == "done" and data["result"] and not data["partial"]:
+                await save_quiz(topic_id, json.dumps(data["result"]))
+            yield event, data
+
+
+async def stream_roadmap(topic_id: str, user_input: List[str]) -> AsyncIterator[Tuple[str, Any]]:
+    # Nodes are the sections under the roadmap's root key, e.g. ["webDevelopmentRoadmap", "Frontend"].
+    async for event, data in stream_generation("roadmap", ROADMAP_PROMPT_VERSION, user_input, roadmap_prompt(user_input), emit_depth=2):
+        if event == "item":
+            path, value = data
+            yield "node", {"path": list(path), "value": value}
+        else:
+            # A partial result goes to this client only; storing it would serve it as complete later.
+            if event == "done" and data["result"] and not data["partial"]:
+                await save_roadmap(topic_id, json.dumps(data["result"]))
+            yield event, data
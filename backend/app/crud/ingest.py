@@ -0,0 +1,165 @@
+import os
+import asyncio
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List, Optional
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "8"))
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(50 * 1024 * 1024)))
+CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "2000"))  # input budget per summarize call
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "8"))  # per document, on top of the LLM limit
+CHARS_PER_TOKEN = 4  # rough average for English text; good enough for budgeting
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+class DocumentTooLargeError(Exception):
+    pass
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def read_document(chunks: AsyncIterator[bytes], max_bytes: int = INGEST_MAX_BYTES) -> bytes:
+    # Stops as soon as the upload passes max_bytes; chunked uploads have no Content-Length to check up front.
+    data = bytearray()
+    async for chunk in chunks:
+        data += chunk
+        if len(data) > max_bytes:
+            raise DocumentTooLargeError(f"Document is larger than {max_bytes} bytes")
+    return bytes(data)
+
+# ---------------------------
+# PDF extraction (runs in worker processes)
+# ---------------------------
+# Workers get the path of a temp copy of the PDF, not its bytes: sending the whole document to
+# every page-range task multiplied the IPC by the task count, and pdfium loads pages lazily from a file.
+def _page_count(path: str) -> int:
+    import pypdfium2 as pdfium  # type: ignore
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _extract_pages(path: str, start: int, end: int) -> List[str]:
+    import pypdfium2 as pdfium  # type: ignore
+    pdf = pdfium.PdfDocument(path)
+    try:
+        pages = []
+        for index in range(start, end):
+            textpage = pdf[index].get_textpage()
+            pages.append(textpage.get_text_range())
+            textpage.close()
+        return pages
+    finally:
+        pdf.close()
+
+
+def _write_temp(data: bytes) -> str:
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(data)
+        return f.name
+
+
+async def extract_pdf_text(data: bytes) -> str:
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    path = await loop.run_in_executor(None, _write_temp, data)
+    try:
+        count = await loop.run_in_executor(executor, _page_count, path)
+        ranges = [(start, min(start + INGEST_PAGES_PER_TASK, count)) for start in range(0, count, INGEST_PAGES_PER_TASK)]
+        batches = await asyncio.gather(*[loop.run_in_executor(executor, _extract_pages, path, start, end) for start, end in ranges])
+    finally:
+        os.remove(path)
+    return "\n\n".join(page for batch in batches for page in batch)
+
+
+async def document_text(data: bytes, content_type: str) -> str:
+    if content_type.startswith("application/pdf"):
+        return await extract_pdf_text(data)
+    if content_type.startswith("text/") or not content_type:
+        return data.decode("utf-8", errors="replace")
+    raise ValueError(f"Unsupported document type: {content_type}")
+
+# ---------------------------
+# Token-budgeted chunking
+# ---------------------------
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    # Packs paragraphs into chunks under the budget; a paragraph that alone is too big is split by characters.
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks, current = [], ""
+    for paragraph in (p.strip() for p in text.split("\n\n")):
+        if not paragraph:
+            continue
+        while len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+def pack_summaries(summaries: List[str], max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    # Every summary is cut to half the budget so any two fit in one chunk: each reduce level
+    # then at least halves the count, however long the model's summaries come back.
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    part = max(1, (max_chars - 2) // 2)
+    chunks, current = [], ""
+    for summary in (s.strip()[:part] for s in summaries):
+        if current and len(current) + len(summary) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{summary}" if current else summary
+    if current:
+        chunks.append(current)
+    return chunks
+
+# ---------------------------
+# Map-reduce summarization
+# ---------------------------
+async def summarize_long_text(text: str, max_tokens: int = CHUNK_TOKENS) -> str:
+    # Map: summarize every chunk concurrently. Reduce: pack the summaries at least two to a
+    # chunk and summarize again, level by level, until one is left. Depth is log2 of the chunks.
+    from crud.functions import summarize_text
+
+    semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def summarize(chunk: str) -> str:
+        async with semaphore:
+            return await summarize_text(chunk)
+
+    chunks = chunk_text(text, max_tokens)
+    if not chunks:
+        return ""
+    level = 0
+    while True:
+        summaries = await asyncio.gather(*[summarize(chunk) for chunk in chunks])
+        level += 1
+        print(f"Summarized {len(chunks)} chunks at level {level}")
+        if len(summaries) == 1:
+            return summaries[0]
+        chunks = pack_summaries(summaries, max_tokens)
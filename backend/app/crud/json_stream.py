@@ -0,0 +1,120 @@
+import json
+from typing import Any, List, Tuple
+
+WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONParser:
+    # Feed model output as it streams; get back every value that completes at `emit_depth`
+    # (1 = items of the root array/object, 2 = their children, ...) as (path, value) pairs.
+    # Text before the root '{'/'[' (preamble, ```json fences) and after it closes is ignored.
+    def __init__(self, emit_depth: int = 1):
+        self.emit_depth = emit_depth
+        self.buffer = ""
+        self.done = False
+        self.root = None  # "[" or "{" once the root value has started
+        self._root_start = 0
+        self._pos = 0
+        self._started = False
+        self._stack: List[list] = []  # [container char, key or index, expecting a key]
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._value_start = None  # start of the value being collected at emit_depth
+        self._scalar = False
+
+    def _path(self) -> Tuple:
+        return tuple(frame[1] for frame in self._stack)
+
+    def _emit(self, end: int, out: list):
+        try:
+            out.append((self._path(), json.loads(self.buffer[self._value_start:end])))
+        except json.JSONDecodeError:
+            pass  # malformed element: skip it, keep going with the rest
+        self._value_start = None
+        self._scalar = False
+
+    def feed(self, text: str) -> List[Tuple[Tuple, Any]]:
+        out: List[Tuple[Tuple, Any]] = []
+        self.buffer += text
+        while self._pos < len(self.buffer) and not self.done:
+            i = self._pos
+            ch = self.buffer[i]
+            self._pos += 1
+
+            if not self._started:
+                if ch in "{[":
+                    self._started = True
+                    self.root = ch
+                    self._root_start = i
+                    self._stack.append([ch, 0 if ch == "[" else None, ch == "{"])
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = self._stack[-1]
+                    if frame[0] == "{" and frame[2]:
+                        frame[1] = json.loads(self.buffer[self._string_start:i + 1])
+                        frame[2] = False
+                    elif self._value_start is not None and not self._scalar and self._value_start == self._string_start:
+                        self._emit(i + 1, out)
+                continue
+
+            if self._scalar and (ch in ",}]" or ch in WHITESPACE):
+                self._emit(i, out)
+
+            depth = len(self._stack)
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+                if depth == self.emit_depth and self._value_start is None and not self._stack[-1][2]:
+                    self._value_start = i
+            elif ch in "{[":
+                if depth == self.emit_depth and self._value_start is None:
+                    self._value_start = i
+                self._stack.append([ch, 0 if ch == "[" else None, ch == "{"])
+            elif ch in "}]":
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                elif len(self._stack) == self.emit_depth and self._value_start is not None:
+                    self._emit(i + 1, out)
+            elif ch == ",":
+                frame = self._stack[-1]
+                if frame[0] == "[":
+                    frame[1] += 1
+                else:
+                    frame[2] = True
+            elif ch == ":" or ch in WHITESPACE:
+                pass
+            elif depth == self.emit_depth and self._value_start is None:
+                self._value_start = i  # number / true / false / null
+                self._scalar = True
+        return out
+
+    def result(self) -> Any:
+        # The whole root value if it closed and parses, else None.
+        if not self.done:
+            return None
+        try:
+            return json.loads(self.buffer[self._root_start:self._pos])
+        except json.JSONDecodeError:
+            return None
+
+
+def assemble(items: List[Tuple[Tuple, Any]], root: str):
+    # Rebuilds what was received from (path, value) pairs, e.g. when the tail of the output is broken.
+    if root == "[":
+        return [value for _, value in items]
+    result: dict = {}
+    for path, value in items:
+        node = result
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = value
+    return result
@@ -0,0 +1,100 @@
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from db.crud import get_cached_response, store_cached_response
+from utils.keys import request_key
+from utils.metrics import collectors
+from utils.singleflight import SingleFlight
+
+LLM_CACHE_LRU_SIZE = int(os.getenv("LLM_CACHE_LRU_SIZE", "256"))
+LLM_CACHE_LRU_TTL = float(os.getenv("LLM_CACHE_LRU_TTL", "600"))
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+_memory = LRUCache(LLM_CACHE_LRU_SIZE, LLM_CACHE_LRU_TTL)
+_generations = SingleFlight("llm")
+stats = {"memory_hits": 0, "mongo_hits": 0, "misses": 0}
+collectors.append(lambda: [
+    ("llm_cache_lookups_total", "counter", "LLM cache lookups by where they were answered", {"result": result}, count)
+    for result, count in stats.items()
+])
+
+
+def cache_key(kind: str, version: str, user_input: Any) -> str:
+    return request_key(kind=kind, version=version, input=user_input)
+
+
+async def cached_generation(kind: str, version: str, user_input: Any, generate: Callable[[], Awaitable[Any]]) -> Any:
+    key = cache_key(kind, version, user_input)
+
+    response = _memory.get(key)
+    if response is not None:
+        stats["memory_hits"] += 1
+        return response
+
+    # Identical requests arriving together share one Mongo lookup and at most one model call.
+    return await _generations.do(key, lambda: _load_or_generate(key, kind, generate))
+
+
+async def _load_or_generate(key: str, kind: str, generate: Callable[[], Awaitable[Any]]) -> Any:
+    response = await get_cached_response(key)
+    if response is not None:
+        stats["mongo_hits"] += 1
+        _memory.set(key, response)
+        return response
+
+    stats["misses"] += 1
+    response = await generate()
+    if response:  # don't cache failed/empty generations
+        await store_cached_response(key, kind, response)
+        _memory.set(key, response)
+    return response
+
+
+async def lookup_generation(kind: str, version: str, user_input: Any) -> Optional[Any]:
+    # Cache read without generating on a miss (used by the streaming endpoints).
+    key = cache_key(kind, version, user_input)
+    response = _memory.get(key)
+    if response is not None:
+        stats["memory_hits"] += 1
+        return response
+    response = await get_cached_response(key)
+    if response is not None:
+        stats["mongo_hits"] += 1
+        _memory.set(key, response)
+        return response
+    stats["misses"] += 1
+    return None
+
+
+async def store_generation(kind: str, version: str, user_input: Any, response: Any):
+    key = cache_key(kind, version, user_input)
+    await store_cached_response(key, kind, response)
+    _memory.set(key, response)
@@ -0,0 +1,124 @@
+import os
+import asyncio
+import random
+import logging
+import httpx  # type: ignore
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError  # type: ignore
+from typing import AsyncIterator, Optional
+from utils.metrics import Counter, Histogram
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))  # concurrent completions per worker
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))  # keep-alive connections to the API
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+logger = logging.getLogger(__name__)
+
+LLM_LATENCY = Histogram("llm_request_seconds", "Time spent in LLM calls, excluding waits for a free slot", labels=["operation"])
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the LLM API", labels=["type"])
+LLM_RETRIES = Counter("llm_retries_total", "LLM calls retried after a transient error", labels=["error"])
+
+_client: Optional[AsyncOpenAI] = None
+_in_flight: Optional[asyncio.Semaphore] = None
+
+
+def get_client() -> AsyncOpenAI:
+    # One client (and connection pool) shared by every request in this worker.
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            timeout=LLM_TIMEOUT,
+            max_retries=0,  # retries are handled below, with jitter and outside the semaphore
+            http_client=httpx.AsyncClient(
+                timeout=LLM_TIMEOUT,
+                limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+            ),
+        )
+    return _client
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _in_flight
+    if _in_flight is None:
+        _in_flight = asyncio.Semaphore(LLM_MAX_IN_FLIGHT)
+    return _in_flight
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def record_usage(usage):
+    if usage is not None:
+        LLM_TOKENS.inc("prompt", amount=usage.prompt_tokens)
+        LLM_TOKENS.inc("completion", amount=usage.completion_tokens)
+
+
+async def complete(prompt: str, model: str = LLM_MODEL) -> str:
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with _get_semaphore():
+                with LLM_LATENCY.time("complete"):
+                    response = await get_client().chat.completions.create(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}]
+                    )
+            record_usage(response.usage)
+            return response.choices[0].message.content.strip()
+        except RETRYABLE_ERRORS as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            LLM_RETRIES.inc(type(e).__name__)
+            # Full jitter so a burst of failures doesn't retry in lockstep.
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            logger.warning(f"LLM call failed ({type(e).__name__}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+async def complete_stream(prompt: str, model: str = LLM_MODEL) -> AsyncIterator[str]:
+    # Yields content deltas as they arrive. Only opening the stream is retried: once tokens
+    # have been handed to the caller, a failure is raised so it can keep what it already has.
+    # The slot is taken per attempt, like complete(), so a backoff sleep doesn't hold one;
+    # once the stream is open it is kept until the last chunk has been read.
+    semaphore = _get_semaphore()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await semaphore.acquire()
+        try:
+            stream = await get_client().chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                stream_options={"include_usage": True},  # usage arrives on a final chunk without choices
+            )
+            break
+        except RETRYABLE_ERRORS as e:
+            semaphore.release()
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            LLM_RETRIES.inc(type(e).__name__)
+            delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            logger.warning(f"LLM stream failed to open ({type(e).__name__}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        except BaseException:
+            semaphore.release()
+            raise
+
+    try:
+        with LLM_LATENCY.time("stream"):
+            async for chunk in stream:
+                if chunk.usage:
+                    record_usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+    finally:
+        semaphore.release()
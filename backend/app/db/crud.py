@@ -1,53 +1,253 @@
-from db.models import Topic, Quiz, Roadmap, GeneratedTopic, Score
-from typing import List
+import asyncio
+from db.models import Topic, Quiz, Roadmap, GeneratedTopic, Score, VideoJob, LLMCacheEntry
+from db.models import TopicView, QuizView, RoadmapView, GeneratedTopicView, ScoreView, DashboardTopicView
+from beanie import PydanticObjectId
+from beanie.operators import In
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Any, List, Optional
+from utils.metrics import Histogram, timed
 
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+MONGO_LATENCY = Histogram("mongo_operation_seconds", "Time spent in MongoDB calls", labels=["operation"])
+
+async def paginate(query, projection, cursor: Optional[str] = None, limit: int = PAGE_SIZE):
+    # Keyset pagination on _id: each page is an index range scan, however deep the cursor is.
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor and PydanticObjectId.is_valid(cursor):
+        query = query.find({"_id": {"$gt": PydanticObjectId(cursor)}})
+    items = await query.sort([("_id", ASCENDING)]).limit(limit + 1).project(projection).to_list()
+    next_cursor = str(items[limit - 1].id) if len(items) > limit else None
+    return items[:limit], next_cursor
+
+@timed(MONGO_LATENCY)
 async def create_topic(name: str, userId: str):
     topic = Topic(userId=userId, name=name)
     await topic.insert()
     return topic.id
 
+@timed(MONGO_LATENCY)
 async def create_quiz(topic_id: str, question_data: str):
     quiz = Quiz(topic_id=topic_id, question_data=question_data)
     await quiz.insert()
     return quiz
 
+@timed(MONGO_LATENCY)
 async def create_roadmap(topic_id: str, steps: str):
     roadmap = Roadmap(topic_id=topic_id, steps=steps)
     await roadmap.insert()
     return roadmap
 
+async def save_quiz(topic_id: str, question_data: str):
+    # Regenerating a cached quiz for the same topic shouldn't pile up identical documents.
+    with MONGO_LATENCY.time("find_quiz"):
+        existing = await Quiz.find_one(Quiz.topic_id == topic_id, Quiz.question_data == question_data)
+    return existing or await create_quiz(topic_id, question_data)
+
+async def save_roadmap(topic_id: str, steps: str):
+    with MONGO_LATENCY.time("find_roadmap"):
+        existing = await Roadmap.find_one(Roadmap.topic_id == topic_id, Roadmap.steps == steps)
+    return existing or await create_roadmap(topic_id, steps)
+
+@timed(MONGO_LATENCY)
 async def create_generated_topics(topic_id: str, difficulty: List[str], medium: List[str], easy: List[str]):
     generated_topics = GeneratedTopic(topic_id=topic_id, difficulty=difficulty, medium=medium, easy=easy)
     await generated_topics.insert()
     return generated_topics
 
+@timed(MONGO_LATENCY)
+async def create_topic_with_generated_topics(name: str, userId: str, difficulty: List[str], medium: List[str], easy: List[str]):
+    # The topic's _id is assigned here instead of by its insert, so neither write waits for the other.
+    topic = Topic(id=PydanticObjectId(), userId=userId, name=name)
+    generated_topics = GeneratedTopic(topic_id=str(topic.id), difficulty=difficulty, medium=medium, easy=easy)
+    await asyncio.gather(topic.insert(), generated_topics.insert())
+    return topic.id
+
+@timed(MONGO_LATENCY)
 async def store_points(userId: str, points: int):
-    existing_score = await Score.find_one({"userId": userId})
-
-    if existing_score:
-        existing_score.points += points
-        await existing_score.save()
-    else:
-        new_score = Score(userId=userId, points=points)
-        await new_score.insert()
-        return new_score
-    
-    return existing_score
+    # One atomic upsert-increment, so concurrent submits for the same user can't lose points.
+    raw = await Score.get_motor_collection().find_one_and_update(
+        {"userId": userId},
+        {"$inc": {"points": points}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return Score.model_validate(raw)
 
+@timed(MONGO_LATENCY)
 async def get_points(userId: str):
-    return await Score.find_one({"userId":userId});
+    return await Score.find_one(Score.userId == userId)
 
+@timed(MONGO_LATENCY)
+async def get_top_scores(limit: int):
+    return await Score.find().sort([("points", DESCENDING)]).limit(limit).project(ScoreView).to_list()
+
+@timed(MONGO_LATENCY)
+async def count_scores_above(points: int):
+    return await Score.find(Score.points > points).count()
+
+@timed(MONGO_LATENCY)
 async def get_topic(topic_id: str):
     return await Topic.find(Topic.topic_id == topic_id).to_list()
 
-async def get_topics(userId: str):
-    return await Topic.find({"userId": userId}).to_list()
+@timed(MONGO_LATENCY)
+async def get_topics(userId: str, cursor: Optional[str] = None, limit: int = PAGE_SIZE):
+    return await paginate(Topic.find(Topic.userId == userId), TopicView, cursor, limit)
+
+@timed(MONGO_LATENCY)
+async def get_quizzes(topic_id: str, cursor: Optional[str] = None, limit: int = PAGE_SIZE):
+    return await paginate(Quiz.find(Quiz.topic_id == topic_id), QuizView, cursor, limit)
+
+@timed(MONGO_LATENCY)
+async def get_roadmaps(topic_id: str, cursor: Optional[str] = None, limit: int = PAGE_SIZE):
+    return await paginate(Roadmap.find(Roadmap.topic_id == topic_id), RoadmapView, cursor, limit)
+
+@timed(MONGO_LATENCY)
+async def get_generatedTopics(topic_id: str, cursor: Optional[str] = None, limit: int = PAGE_SIZE):
+    return await paginate(GeneratedTopic.find(GeneratedTopic.topic_id == topic_id), GeneratedTopicView, cursor, limit)
+
+def _lookup(collection: str, pipeline: list, name: str) -> dict:
+    # Child documents store the topic id as a string, hence the join on topic_key; the
+    # equality join uses each collection's (topic_id, _id) index.
+    return {"$lookup": {"from": collection, "localField": "topic_key", "foreignField": "topic_id", "pipeline": pipeline, "as": name}}
+
+@timed(MONGO_LATENCY)
+async def get_dashboard(userId: str, cursor: Optional[str] = None, limit: int = PAGE_SIZE):
+    # A page of the user's topics with their generated topics, quiz count and roadmaps, in one round trip.
+    # The page is cut before the joins, so only the returned topics are looked up.
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    match: dict = {"userId": userId}
+    if cursor and PydanticObjectId.is_valid(cursor):
+        match["_id"] = {"$gt": PydanticObjectId(cursor)}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"_id": ASCENDING}},
+        {"$limit": limit + 1},
+        {"$project": {"name": 1, "topic_key": {"$toString": "$_id"}}},
+        _lookup("generated_topics", [{"$project": {"difficulty": 1, "medium": 1, "easy": 1}}], "generated_topics"),
+        _lookup("quizzes", [{"$count": "count"}], "quiz_count"),
+        _lookup("roadmaps", [{"$project": {"steps": 1}}], "roadmaps"),
+        {"$project": {
+            "name": 1,
+            "generated_topics": 1,
+            "roadmaps": 1,
+            "quiz_count": {"$ifNull": [{"$first": "$quiz_count.count"}, 0]},
+        }},
+    ]
+    items = await Topic.aggregate(pipeline, projection_model=DashboardTopicView).to_list()
+    next_cursor = str(items[limit - 1].id) if len(items) > limit else None
+    return items[:limit], next_cursor
+
+@timed(MONGO_LATENCY)
+async def create_video_job(topic_prompt: str, prompt_key: str = None, segmented: bool = False, priority: int = 0, **fields):
+    job = VideoJob(topic_prompt=topic_prompt, prompt_key=prompt_key, segmented=segmented, priority=priority, **fields)
+    await job.insert()
+    return job
+
+@timed(MONGO_LATENCY)
+async def get_video_job(job_id: str):
+    if not PydanticObjectId.is_valid(job_id):
+        return None
+    return await VideoJob.get(PydanticObjectId(job_id))
+
+@timed(MONGO_LATENCY)
+async def update_video_job(job_id: str, **fields):
+    fields["updated_at"] = datetime.utcnow()
+    await VideoJob.find_one(VideoJob.id == PydanticObjectId(job_id)).update({"$set": fields})
+
+@timed(MONGO_LATENCY)
+async def update_video_job_progress(job_id: str, stage: str, progress: float):
+    # Only touch jobs that are still in flight so a late progress message can't undo a finished job.
+    await VideoJob.find_one(
+        VideoJob.id == PydanticObjectId(job_id),
+        In(VideoJob.status, ["queued", "running"]),
+    ).update({"$set": {"status": "running", "stage": stage, "progress": progress, "updated_at": datetime.utcnow()}})
+
+@timed(MONGO_LATENCY)
+async def find_unfinished_video_job(prompt_key: str):
+    return await VideoJob.find_one(VideoJob.prompt_key == prompt_key, In(VideoJob.status, ["queued", "running"]))
+
+def _lease_lapsed(now: datetime) -> dict:
+    return {"status": {"$in": ["queued", "running"]}, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]}
+
+@timed(MONGO_LATENCY)
+async def get_claimable_video_jobs():
+    # Unfinished jobs no API worker holds a live lease on: never claimed, or their owner stopped.
+    return await VideoJob.find(_lease_lapsed(datetime.utcnow())).sort(+VideoJob.created_at).to_list()
+
+@timed(MONGO_LATENCY)
+async def claim_video_job(job_id: str, owner: str, lease_until: datetime):
+    # One atomic find-and-modify, so when several workers resume at once only one gets each job.
+    now = datetime.utcnow()
+    raw = await VideoJob.get_motor_collection().find_one_and_update(
+        {"_id": PydanticObjectId(job_id), **_lease_lapsed(now)},
+        {"$set": {"owner": owner, "lease_until": lease_until, "updated_at": now}},
+        return_document=ReturnDocument.AFTER,
+    )
+    return VideoJob.model_validate(raw) if raw else None
+
+@timed(MONGO_LATENCY)
+async def requeue_video_job(job_id: str):
+    # Back to queued, unowned, for a finished job whose reel was evicted. Conditional on "done",
+    # so of several requests noticing at once only one requeues it.
+    raw = await VideoJob.get_motor_collection().find_one_and_update(
+        {"_id": PydanticObjectId(job_id), "status": "done"},
+        {"$set": {"status": "queued", "stage": None, "progress": 0.0, "video_path": None,
+                  "owner": None, "lease_until": None, "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    return VideoJob.model_validate(raw) if raw else None
+
+@timed(MONGO_LATENCY)
+async def count_queued_video_jobs() -> int:
+    return await VideoJob.find(VideoJob.status == "queued").count()
+
+@timed(MONGO_LATENCY)
+async def get_promoted_video_jobs(job_ids: List[str], priority: int):
+    # Jobs raised to `priority` by a submission that went to another API worker.
+    return await VideoJob.find(
+        In(VideoJob.id, [PydanticObjectId(job_id) for job_id in job_ids]),
+        VideoJob.priority <= priority,
+    ).to_list()
+
+@timed(MONGO_LATENCY)
+async def renew_video_job_leases(owner: str, job_ids: List[str], lease_until: datetime):
+    await VideoJob.get_motor_collection().update_many(
+        {"_id": {"$in": [PydanticObjectId(job_id) for job_id in job_ids]}, "owner": owner},
+        {"$set": {"lease_until": lease_until}},
+    )
+
+@timed(MONGO_LATENCY)
+async def release_video_job_leases(owner: str):
+    # On a clean shutdown, so the next worker to start resumes the jobs without waiting out the lease.
+    await VideoJob.get_motor_collection().update_many(
+        {"owner": owner, "status": {"$in": ["queued", "running"]}},
+        {"$set": {"lease_until": None}},
+    )
 
-async def get_quizzes(topic_id: str):
-    return await Quiz.find(Quiz.topic_id == topic_id).to_list()
+@timed(MONGO_LATENCY)
+async def get_popular_topic_names(limit: int, max_length: int = 200) -> List[str]:
+    # Most requested topic names, counted case- and whitespace-insensitively. Long names are
+    # summaries of pasted documents and unlikely to be asked for again, so they are skipped.
+    pipeline = [
+        {"$match": {"$expr": {"$lte": [{"$strLenCP": "$name"}, max_length]}}},
+        {"$group": {"_id": {"$toLower": {"$trim": {"input": "$name"}}}, "name": {"$first": "$name"}, "count": {"$sum": 1}}},
+        {"$sort": {"count": DESCENDING}},
+        {"$limit": limit},
+    ]
+    return [entry["name"] for entry in await Topic.aggregate(pipeline).to_list()]
 
-async def get_roadmaps(topic_id: str):
-    return await Roadmap.find(Roadmap.topic_id == topic_id).to_list()
+@timed(MONGO_LATENCY)
+async def get_cached_response(key: str):
+    entry = await LLMCacheEntry.find_one(LLMCacheEntry.key == key)
+    return entry.response if entry else None
 
-async def get_generatedTopics(topic_id: str):
-    return await GeneratedTopic.find(GeneratedTopic.topic_id == topic_id).to_list()
+@timed(MONGO_LATENCY)
+async def store_cached_response(key: str, kind: str, response: Any):
+    try:
+        await LLMCacheEntry(key=key, kind=kind, response=response).insert()
+    except DuplicateKeyError:
+        pass  # another worker cached the same generation first
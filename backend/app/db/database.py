@@ -1,16 +1,19 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
-from db.models import Topic, Quiz, Roadmap, GeneratedTopic, Score
+from db.models import Topic, Quiz, Roadmap, GeneratedTopic, Score, VideoJob, LLMCacheEntry
 import os
 from dotenv import load_dotenv
 
 load_dotenv(".env")
 MONGO_URI = os.getenv("MONGO_URI")  # Default if None
+MONGO_DB = os.getenv("MONGO_DB", "yantra-hack")
+MONGO_TLS = os.getenv("MONGO_TLS", "1") == "1"  # set to 0 for a local mongod (e.g. the load benchmark)
 
-
-client = AsyncIOMotorClient(MONGO_URI, tls=True, tlsAllowInvalidCertificates=True)
-db = client.get_database("yantra-hack")
+# pymongo rejects TLS options when TLS is off, so they are only passed with it on.
+tls_options = {"tls": True, "tlsAllowInvalidCertificates": True} if MONGO_TLS else {}
+client = AsyncIOMotorClient(MONGO_URI, **tls_options)
+db = client.get_database(MONGO_DB)
 
 async def init_db():
-    await init_beanie(database=db, document_models=[Topic, Quiz, Roadmap, GeneratedTopic, Score])
+    await init_beanie(database=db, document_models=[Topic, Quiz, Roadmap, GeneratedTopic, Score, VideoJob, LLMCacheEntry])
     print("hello world")
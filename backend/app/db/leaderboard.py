@@ -0,0 +1,57 @@
+import os
+import time
+from typing import List, Optional
+from db.crud import count_scores_above, get_points, get_top_scores
+from db.models import ScoreView
+from utils.singleflight import SingleFlight
+
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "100"))  # entries kept in the snapshot
+LEADERBOARD_TTL = float(os.getenv("LEADERBOARD_TTL", "5"))  # seconds a snapshot is served before refreshing
+
+_snapshot: List[ScoreView] = []
+_expires_at = 0.0
+_refresh = SingleFlight("leaderboard")
+
+
+async def _load_snapshot() -> List[ScoreView]:
+    global _snapshot, _expires_at
+    _snapshot = await get_top_scores(LEADERBOARD_SIZE)
+    _expires_at = time.monotonic() + LEADERBOARD_TTL
+    return _snapshot
+
+
+async def get_snapshot() -> List[ScoreView]:
+    # Polling clients are served from memory; at most one refresh query per TTL per worker.
+    if time.monotonic() < _expires_at:
+        return _snapshot
+    return await _refresh.do("top", _load_snapshot)
+
+
+def _ranked(entries: List[ScoreView], start_rank: int = 1) -> List[dict]:
+    # Competition ranking: equal points share a rank, the next rank skips ahead.
+    ranked = []
+    for position, entry in enumerate(entries):
+        if position and entry.points == entries[position - 1].points:
+            rank = ranked[-1]["rank"]
+        else:
+            rank = start_rank + position
+        ranked.append({"rank": rank, "userId": entry.userId, "points": entry.points})
+    return ranked
+
+
+async def get_leaderboard(limit: int = 10) -> List[dict]:
+    # Capped at the snapshot size so no limit can turn a poll into a Mongo query.
+    limit = min(max(1, limit), LEADERBOARD_SIZE)
+    return _ranked(await get_snapshot())[:limit]
+
+
+async def get_rank(userId: str) -> Optional[dict]:
+    for entry in _ranked(await get_snapshot()):
+        if entry["userId"] == userId:
+            return entry
+
+    score = await get_points(userId)
+    if score is None:
+        return None
+    rank = await count_scores_above(score.points) + 1
+    return {"rank": rank, "userId": userId, "points": score.points}
@@ -1,5 +1,12 @@
-from beanie import Document
-from typing import List
+import os
+from beanie import Document, PydanticObjectId
+from datetime import datetime
+from pydantic import BaseModel, Field
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from typing import Any, List, Optional
+
+# How long cached LLM generations live before Mongo's TTL monitor drops them.
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
 
 class Topic(Document):
     userId: str
@@ -7,6 +14,7 @@ class Topic(Document):
 
     class Settings:
         name = "topics"
+        indexes = [IndexModel([("userId", ASCENDING), ("_id", ASCENDING)])]
 
 class Quiz(Document):
     topic_id: str
@@ -14,6 +22,7 @@ class Quiz(Document):
 
     class Settings:
         name = "quizzes"
+        indexes = [IndexModel([("topic_id", ASCENDING), ("_id", ASCENDING)])]
 
 class Roadmap(Document):
     topic_id: str
@@ -21,6 +30,7 @@ class Roadmap(Document):
 
     class Settings:
         name = "roadmaps"
+        indexes = [IndexModel([("topic_id", ASCENDING), ("_id", ASCENDING)])]
 
 class GeneratedTopic(Document):
     topic_id: str
@@ -30,6 +40,7 @@ class GeneratedTopic(Document):
     
     class Settings:
         name = "generated_topics"
+        indexes = [IndexModel([("topic_id", ASCENDING), ("_id", ASCENDING)])]
 
 class Score(Document):
     userId: str
@@ -37,3 +48,75 @@ class Score(Document):
 
     class Settings:
         name = "Scores"
+        indexes = [
+            IndexModel([("userId", ASCENDING)], unique=True),
+            IndexModel([("points", DESCENDING)]),
+        ]
+
+class VideoJob(Document):
+    topic_prompt: str
+    prompt_key: Optional[str] = None  # normalized prompt hash, used to attach duplicate requests
+    segmented: bool = False  # also publish scenes as HLS while rendering
+    priority: int = 0  # 0 interactive, 1 batch prewarm (see ml.admission)
+    status: str = "queued"  # queued | running | done | error
+    stage: Optional[str] = None
+    progress: float = 0.0
+    video_path: Optional[str] = None
+    error: Optional[str] = None
+    owner: Optional[str] = None  # API worker rendering it
+    lease_until: Optional[datetime] = None  # the owner renews this; once it lapses another worker may resume the job
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "video_jobs"
+        indexes = [
+            IndexModel([("status", ASCENDING), ("created_at", ASCENDING)]),
+            IndexModel([("prompt_key", ASCENDING), ("status", ASCENDING)]),
+        ]
+
+class LLMCacheEntry(Document):
+    key: str
+    kind: str
+    response: Any
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "llm_cache"
+        indexes = [
+            IndexModel([("key", ASCENDING)], unique=True),
+            IndexModel([("created_at", ASCENDING)], expireAfterSeconds=LLM_CACHE_TTL_SECONDS),
+        ]
+
+# ---------------------------
+# Projections returned by the list endpoints (the caller already knows the filter field)
+# ---------------------------
+class TopicView(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    name: str
+
+class QuizView(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    question_data: str
+
+class RoadmapView(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    steps: str
+
+class GeneratedTopicView(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    difficulty: List[str]
+    medium: List[str]
+    easy: List[str]
+
+class ScoreView(BaseModel):
+    userId: str
+    points: int
+
+class DashboardTopicView(BaseModel):
+    # One topic with everything the dashboard shows for it, joined in a single aggregation.
+    id: PydanticObjectId = Field(alias="_id")
+    name: str
+    generated_topics: List[GeneratedTopicView]
+    quiz_count: int
+    roadmaps: List[RoadmapView]
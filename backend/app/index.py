@@ -1,21 +1,49 @@
-from fastapi import FastAPI, HTTPException, Header
+import os
+import re
+import math
+import asyncio
+import json
+from fastapi import FastAPI, HTTPException, Header, Request, Response
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from contextlib import asynccontextmanager
 from db.database import init_db
-from db.crud import get_generatedTopics, get_quizzes, get_topics, get_roadmaps, create_quiz, create_topic, create_roadmap, store_points, get_points
-from crud.functions import generate_quiz, generate_roadmap, generate_topics
+from db.leaderboard import get_leaderboard, get_rank
+from db.crud import get_generatedTopics, get_quizzes, get_topics, get_roadmaps, create_quiz, create_topic, create_roadmap, store_points, get_points, get_video_job, get_dashboard, PAGE_SIZE
+from crud.functions import generate_quiz, generate_roadmap, generate_topics, stream_quiz, stream_roadmap
+from crud.llm_client import close_client
+from crud.ingest import INGEST_MAX_BYTES, DocumentTooLargeError, document_text, read_document, shutdown_executor
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from ml.generate_video import create_final_reel
+from fastapi.responses import StreamingResponse
+from ml.admission import BATCH, INTERACTIVE, CircuitOpenError
+from ml.video_queue import QueueFullError, VideoJobQueue
+from ml.hls import HLS_ROOT, PLAYLIST_NAME, hls_gc_loop
+from ml.reel_cache import reel_cache, reel_key
+from ml.workspace import scratch_gc_loop
+from utils.http import serve_file
+from utils.metrics import Histogram, TimingMiddleware, collectors, render
+
+video_queue = VideoJobQueue()
+collectors.append(video_queue.samples)
+
+HTTP_LATENCY = Histogram("http_request_seconds", "Time to produce a response (to the first byte for streams)", labels=["method", "route", "status"])
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Starting up...")
     await init_db()
     print("Database initialized")
+    await video_queue.start()
+    scratch_gc = asyncio.create_task(scratch_gc_loop())
+    hls_gc = asyncio.create_task(hls_gc_loop())
     yield
     print("Shutting down...")
+    scratch_gc.cancel()
+    hls_gc.cancel()
+    await video_queue.shutdown()
+    await close_client()
+    shutdown_executor()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -26,8 +54,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods (GET, POST, PUT, DELETE, etc.)
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Next-Cursor", "Server-Timing", "Retry-After"],
 )
 
+app.add_middleware(TimingMiddleware, histogram=HTTP_LATENCY)
+
+def sse(events):
+    # Server-sent events: one "event:"/"data:" block per (event, data) pair.
+    async def body():
+        async for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    # X-Accel-Buffering stops nginx-style proxies from holding events back.
+    return StreamingResponse(body(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def paged(response: Response, page):
+    # List endpoints return the items as before; the cursor for the next page goes in a header.
+    items, next_cursor = page
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return items
+
 class PromptRequest(BaseModel):
     user_input: str
     userId: str
@@ -45,6 +91,8 @@ class GeneratedTopicRequest(BaseModel):
 
 class VideoRequest(BaseModel):
     topic_prompt: str
+    segmented: bool = False  # publish scenes as HLS while the reel is still rendering
+    batch: bool = False  # prewarming: render at low priority, after interactive requests
 
 class QuizSubmitRequest(BaseModel):
     userId: str
@@ -54,23 +102,49 @@ class QuizSubmitRequest(BaseModel):
 async def generate_topic(request: PromptRequest):
     return await generate_topics(request.user_input, request.userId)
 
+@app.post("/documents") #Generates topics from an uploaded PDF or text document (raw request body)
+async def ingest_document(request: Request, user_id: str = Header(...)):
+    if int(request.headers.get("content-length") or 0) > INGEST_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Document too large")
+    try:
+        data = await read_document(request.stream())
+    except DocumentTooLargeError:
+        raise HTTPException(status_code=413, detail="Document too large")
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty document")
+    try:
+        text = await document_text(data, request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    if not text.strip():
+        raise HTTPException(status_code=422, detail="No text found in document")
+    return await generate_topics(text, user_id)
+
 @app.get("/generate") #Gets all topic names from the database
-async def get_generated_topics(user_id: str = Header(...)):
+async def get_generated_topics(response: Response, user_id: str = Header(...), cursor: Optional[str] = None, limit: int = PAGE_SIZE):
     if not user_id:
         raise HTTPException(status_code=400, detail="User-ID header missing")
-    return await get_topics(user_id)
+    return paged(response, await get_topics(user_id, cursor, limit))
+
+@app.get("/dashboard") #A page of the user's topics with generated topics, quiz counts and roadmaps, in one query
+async def get_dashboard_api(response: Response, user_id: str = Header(...), cursor: Optional[str] = None, limit: int = PAGE_SIZE):
+    return paged(response, await get_dashboard(user_id, cursor, limit))
 
 @app.get("/generated_topics/{topic_id}") #Gets all generated topics list from the database for a given topic
-async def get_generated_topics(topic_id: str):
-    return await get_generatedTopics(topic_id)
+async def get_generated_topics(topic_id: str, response: Response, cursor: Optional[str] = None, limit: int = PAGE_SIZE):
+    return paged(response, await get_generatedTopics(topic_id, cursor, limit))
 
 @app.post("/quizzes")
 async def generate_quiz_api(request: QuizRequest):
     return await generate_quiz(request.topic_id, request.question_data)
 
+@app.post("/quizzes/stream") #Streams each quiz question over SSE as soon as it is generated
+async def stream_quiz_api(request: QuizRequest):
+    return sse(stream_quiz(request.topic_id, request.question_data))
+
 @app.get("/quizzes/{topic_id}")
-async def get_generated_quizzes(topic_id: str):
-    return await get_quizzes(topic_id)
+async def get_generated_quizzes(topic_id: str, response: Response, cursor: Optional[str] = None, limit: int = PAGE_SIZE):
+    return paged(response, await get_quizzes(topic_id, cursor, limit))
 
 @app.post("/submit-score")
 async def store_score(request: QuizSubmitRequest):
@@ -82,19 +156,84 @@ async def get_score(user_id: str = Header(...)):
         raise HTTPException(status_code=400, detail="User-ID header missing")
     return await get_points(user_id)
 
+@app.get("/leaderboard") #Top scores, served from a short-lived in-memory snapshot
+async def get_leaderboard_api(limit: int = 10):
+    return await get_leaderboard(limit)
+
+@app.get("/leaderboard/rank")
+async def get_rank_api(user_id: str = Header(...)):
+    if not user_id:
+        raise HTTPException(status_code=400, detail="User-ID header missing")
+    rank = await get_rank(user_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="No score for this user")
+    return rank
+
 @app.post("/roadmaps")
 async def generate_roadmap_api(request: RoadmapRequest):
     return await generate_roadmap(request.topic_id, request.user_input)
 
+@app.post("/roadmaps/stream") #Streams each roadmap section over SSE as soon as it is generated
+async def stream_roadmap_api(request: RoadmapRequest):
+    return sse(stream_roadmap(request.topic_id, request.user_input))
+
 @app.get("/roadmaps")
-async def get_generated_roadmaps():
-    return await get_roadmaps()
+async def get_generated_roadmaps(topic_id: str, response: Response, cursor: Optional[str] = None, limit: int = PAGE_SIZE):
+    return paged(response, await get_roadmaps(topic_id, cursor, limit))
 
-@app.post("/videos")
+@app.post("/videos") #Queues a reel render and returns immediately with the job id
 async def get_generated_videos(request: VideoRequest):
     try:
-        final_reel_path = create_final_reel(request.topic_prompt)
-        return {"status": "success", "video_path": final_reel_path}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}   
-    
+        job = await video_queue.submit(request.topic_prompt, request.segmented, BATCH if request.batch else INTERACTIVE)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    response = {"status": job.status, "job_id": str(job.id)}
+    if job.segmented:
+        response["playlist"] = f"/videos/{job.id}/hls/{PLAYLIST_NAME}"
+    return response
+
+@app.get("/videos/{job_id}") #Status and progress of a queued reel render
+async def get_video_status(job_id: str):
+    job = await get_video_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    return job
+
+@app.get("/videos/{job_id}/stream") #Serves a finished reel with Range and caching headers
+async def stream_video(job_id: str, request: Request):
+    job = await get_video_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    if job.status != "done" or not job.video_path:
+        raise HTTPException(status_code=409, detail=f"Video is not ready (status: {job.status})")
+    # Jobs share reels through the reel cache; the lookup also keeps a watched reel from being evicted.
+    path = reel_cache.lookup(reel_key(job.topic_prompt), "mp4")
+    try:
+        if path is not None:
+            return serve_file(request, path, "video/mp4")
+    except FileNotFoundError:
+        pass  # evicted since the lookup
+    # Evicted: the same job renders it again, so the client just keeps polling it.
+    await video_queue.requeue(job)
+    raise HTTPException(status_code=409, detail="Video expired and is being rendered again")
+
+HLS_FILE = re.compile(r"^[\w-]+\.(m3u8|ts)$")
+
+@app.get("/videos/{job_id}/hls/{name}") #Playlist and segments of a segmented reel, available while it renders
+async def stream_video_hls(job_id: str, name: str, request: Request):
+    job = await get_video_job(job_id)
+    if job is None or not job.segmented or not HLS_FILE.match(name):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = os.path.join(HLS_ROOT, str(job.id), name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    if name.endswith(".m3u8"):
+        # The playlist grows as scenes finish, so clients must always revalidate it.
+        return serve_file(request, path, "application/vnd.apple.mpegurl", max_age=0)
+    return serve_file(request, path, "video/mp2t")
+
+@app.get("/metrics") #Prometheus text exposition of latency histograms, token usage and cache hit counters
+async def get_metrics():
+    return Response(render(), media_type="text/plain; version=0.0.4")
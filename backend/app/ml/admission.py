@@ -0,0 +1,221 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Union
+
+# Priorities: lower runs first.
+INTERACTIVE = 0  # a user is waiting for the reel
+BATCH = 1  # prewarming, can wait
+
+ADMISSION_BACKENDS = {
+    # backend: (initial limit, max limit); the limit adapts in between.
+    "avatar": (int(os.getenv("AVATAR_CONCURRENCY", "2")), int(os.getenv("AVATAR_MAX_CONCURRENCY", "8"))),
+    "manim": (int(os.getenv("MANIM_CONCURRENCY", "2")), int(os.getenv("MANIM_MAX_CONCURRENCY", "8"))),
+}
+LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))  # vs. the best recent latency
+BACKOFF_RATIO = float(os.getenv("ADMISSION_BACKOFF_RATIO", "0.7"))  # limit multiplier after an error
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "900"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))  # consecutive failures that open the circuit
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "60"))
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, backend: str, retry_after: float):
+        super().__init__(f"{backend} is failing, not sending requests for {retry_after:.0f}s")
+        self.backend = backend
+        self.retry_after = retry_after
+
+    def __reduce__(self):
+        # Crosses process boundaries (manager proxies, the process pool) with its fields intact.
+        return (CircuitOpenError, (self.backend, self.retry_after))
+
+
+class AdmissionTimeout(Exception):
+    pass
+
+
+class JobPriority:
+    # A render job's priority as the video queue currently sees it: an interactive request that
+    # joins a prewarm job raises it mid-render. `shared` is a manager dict of job id -> priority.
+    def __init__(self, job_id: str, initial: int, shared=None):
+        self.job_id = job_id
+        self.initial = initial
+        self.shared = shared
+
+    def get(self) -> int:
+        if self.shared is None:
+            return self.initial
+        return self.shared.get(self.job_id, self.initial)
+
+
+Priority = Union[int, JobPriority]
+
+# ---------------------------
+# Adaptive concurrency limit + priority queue + circuit breaker for one backend
+# ---------------------------
+class AdmissionController:
+    # AIMD on the concurrency limit: +1/limit per fast success while the limit is in use,
+    # x0.9 when latency exceeds LATENCY_TOLERANCE x the best recent latency, x BACKOFF_RATIO
+    # on an error. Waiters are admitted by (priority, arrival). Shared across render processes
+    # through a multiprocessing manager, so it sees every call to the backend.
+    def __init__(self, backend: str, initial_limit: int = 2, max_limit: int = 8, min_limit: int = 1):
+        self.backend = backend
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.baseline: Optional[float] = None  # best recent latency, drifts up slowly
+        self.error_rate = 0.0  # EWMA over calls
+        self.failures = 0  # consecutive
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters: list = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+
+    def _state(self, now: float) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "open" if now - self.opened_at < BREAKER_COOLDOWN else "half_open"
+
+    def _can_admit(self, now: float) -> bool:
+        state = self._state(now)
+        if state == "half_open":
+            return not self.probing and self.in_flight == 0  # one probe call at a time
+        return self.in_flight < int(self.limit)
+
+    # acquire() and release() return a snapshot, so workers can report state without another round trip.
+    def acquire(self, priority: int = INTERACTIVE, timeout: float = QUEUE_TIMEOUT, owner: Optional[str] = None) -> dict:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            entry = [priority, next(self._order), owner]  # a list so promote() can change it in place
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._state(now) == "open":
+                        self.rejected += 1
+                        raise CircuitOpenError(self.backend, BREAKER_COOLDOWN - (now - self.opened_at))
+                    if self._waiters[0] is entry and self._can_admit(now):
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise AdmissionTimeout(f"Waited {timeout:.0f}s for a {self.backend} slot")
+                    # Wake up at least when the breaker's cooldown ends.
+                    wait = remaining if self.opened_at is None else min(remaining, max(0.05, BREAKER_COOLDOWN - (now - self.opened_at)))
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+            if self._state(now) == "half_open":
+                self.probing = True
+            self.in_flight += 1
+            self.admitted += 1
+            return self.snapshot()
+
+    def release(self, latency: float, ok: bool) -> dict:
+        with self._cond:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            self.probing = False
+            self.error_rate += 0.1 * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                if self.baseline is None or latency < self.baseline:
+                    self.baseline = latency
+                else:
+                    self.baseline += 0.01 * (latency - self.baseline)
+                if latency > self.baseline * LATENCY_TOLERANCE:
+                    self.limit = max(self.min_limit, self.limit * 0.9)
+                elif saturated:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            else:
+                self.failures += 1
+                self.limit = max(self.min_limit, self.limit * BACKOFF_RATIO)
+                if self.failures >= BREAKER_FAILURES or self._state(time.monotonic()) == "half_open":
+                    self.opened_at = time.monotonic()
+            self._cond.notify_all()
+            return self.snapshot()
+
+    def promote(self, owner: str, priority: int):
+        # Moves an owner's waiting calls up to `priority`; calls already admitted are unaffected.
+        with self._cond:
+            for entry in self._waiters:
+                if entry[2] == owner and entry[0] > priority:
+                    entry[0] = priority
+            heapq.heapify(self._waiters)
+            self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            state = self._state(now)
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "state": state,
+                "retry_after": BREAKER_COOLDOWN - (now - self.opened_at) if state == "open" else 0.0,
+                "error_rate": self.error_rate,
+                "baseline_latency": self.baseline or 0.0,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+# ---------------------------
+# Per-process access
+# ---------------------------
+# Render workers get manager proxies from the video queue via install(); code run outside the
+# queue (e.g. generate_video's main) falls back to local controllers. The queue also passes a
+# report callback, so the API process learns each backend's state without calling the manager.
+_controllers: Dict[str, AdmissionController] = {}
+_report: Optional[Callable[[str, dict], None]] = None
+
+
+def install(controllers: Dict[str, AdmissionController], report: Optional[Callable[[str, dict], None]] = None):
+    global _report
+    _controllers.update(controllers)
+    _report = report
+
+
+def _reported(backend: str, snapshot: dict):
+    if _report is not None:
+        _report(backend, snapshot)
+
+
+def get_controller(backend: str) -> AdmissionController:
+    controller = _controllers.get(backend)
+    if controller is None:
+        initial_limit, max_limit = ADMISSION_BACKENDS[backend]
+        controller = _controllers.setdefault(backend, AdmissionController(backend, initial_limit, max_limit))
+    return controller
+
+
+@contextmanager
+def admitted(backend: str, priority: Priority = INTERACTIVE):
+    # A JobPriority is read when the call queues, and its job id lets the queue promote it while it waits.
+    controller = get_controller(backend)
+    if isinstance(priority, JobPriority):
+        value, owner = priority.get(), priority.job_id
+    else:
+        value, owner = priority, None
+    try:
+        _reported(backend, controller.acquire(value, QUEUE_TIMEOUT, owner))
+    except CircuitOpenError:
+        _reported(backend, controller.snapshot())
+        raise
+    start = time.monotonic()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        _reported(backend, controller.release(time.monotonic() - start, ok))
@@ -0,0 +1,99 @@
+import struct
+import logging
+import threading
+from typing import Iterable, Optional
+
+import ffmpeg # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------
+# In-memory narration audio
+# ---------------------------
+class NarrationAudio:
+    # WAV bytes plus their duration, so later stages neither re-read nor probe the audio.
+    def __init__(self, wav: bytes):
+        self.wav = finalize_wav_header(wav)
+        self.duration = wav_duration(self.wav)
+
+    def __len__(self) -> int:
+        return len(self.wav)
+
+
+def _chunks(wav: bytes):
+    # Yields (chunk_id, header_offset, size) for each RIFF sub-chunk.
+    offset = 12
+    while offset + 8 <= len(wav):
+        chunk_id, size = struct.unpack_from("<4sI", wav, offset)
+        yield chunk_id, offset, size
+        if chunk_id == b"data":
+            return
+        offset += 8 + size + (size & 1)
+
+
+def finalize_wav_header(wav: bytes) -> bytes:
+    # ffmpeg can't seek back on a pipe, so RIFF/data sizes are left as placeholders; fill them in.
+    if wav[:4] != b"RIFF" or wav[8:12] != b"WAVE":
+        raise ValueError("Not a WAV stream")
+    fixed = bytearray(wav)
+    struct.pack_into("<I", fixed, 4, len(wav) - 8)
+    for chunk_id, offset, _ in _chunks(wav):
+        if chunk_id == b"data":
+            struct.pack_into("<I", fixed, offset + 4, len(wav) - offset - 8)
+    return bytes(fixed)
+
+
+def wav_duration(wav: bytes) -> float:
+    byte_rate: Optional[int] = None
+    for chunk_id, offset, size in _chunks(wav):
+        if chunk_id == b"fmt ":
+            byte_rate = struct.unpack_from("<I", wav, offset + 8 + 8)[0]
+        elif chunk_id == b"data" and byte_rate:
+            return size / byte_rate
+    raise ValueError("WAV stream has no fmt/data chunk")
+
+# ---------------------------
+# Pipe encoded audio chunks through ffmpeg straight into a WAV buffer
+# ---------------------------
+def stream_to_wav(chunks: Iterable[bytes], input_format: str = "mp3") -> NarrationAudio:
+    process = (
+        ffmpeg
+        .input("pipe:", format=input_format)
+        .output("pipe:", format="wav", acodec="pcm_s16le")  # Standard WAV format
+        .global_args("-hide_banner", "-loglevel", "error")
+        .run_async(pipe_stdin=True, pipe_stdout=True, pipe_stderr=True)
+    )
+
+    # Feed stdin from a thread while this one drains stdout, so neither pipe can fill up and block.
+    feed_error = []
+
+    def feed():
+        try:
+            for chunk in chunks:
+                if chunk:
+                    process.stdin.write(chunk)
+        except Exception as e:  # network error mid-stream, or ffmpeg exited early
+            feed_error.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    stderr = []
+    drain_stderr = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    drain_stderr.start()
+    wav = process.stdout.read()
+    feeder.join()
+    drain_stderr.join()
+    process.wait()
+
+    if feed_error:
+        raise feed_error[0]
+    if process.returncode != 0:
+        # Not ffmpeg.Error: that one can't be unpickled, and this runs in render worker processes.
+        detail = b"".join(stderr).decode(errors="ignore").strip()
+        raise RuntimeError(f"ffmpeg could not decode the narration audio: {detail}")
+    return NarrationAudio(wav)
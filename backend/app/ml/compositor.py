@@ -0,0 +1,206 @@
+import os
+import math
+import logging
+from typing import List, Optional
+
+import ffmpeg # type: ignore
+
+from ml.hls import HLS_SEGMENT_SECONDS
+
+# Which compositor combine_videos uses first: "ffmpeg" (single filter_complex pass) or "moviepy".
+COMPOSITOR_BACKEND = os.getenv("COMPOSITOR_BACKEND", "ffmpeg")
+COMPOSITOR_PRESET = os.getenv("COMPOSITOR_PRESET", "balanced")
+COMPOSITOR_THREADS = int(os.getenv("COMPOSITOR_THREADS", "0"))  # 0 lets x264 pick
+REEL_WIDTH = int(os.getenv("REEL_WIDTH", "720"))
+# Forced keyframe spacing (seconds), so composited scenes can be cut into HLS segments by stream copy.
+# It divides HLS_SEGMENT_SECONDS, so every segment ends on a keyframe at exactly that length.
+KEYFRAME_INTERVAL = math.gcd(2, HLS_SEGMENT_SECONDS)
+
+# Encoder settings per preset name, shared by both backends.
+PRESETS = {
+    "speed": {"preset": "veryfast", "crf": 26},
+    "balanced": {"preset": "medium", "crf": 23},
+    "quality": {"preset": "slow", "crf": 20},
+}
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------
+# Probing helpers
+# ---------------------------
+def probe_media(path: str) -> dict:
+    info = ffmpeg.probe(path)
+    return {
+        "duration": float(info["format"]["duration"]),
+        "has_audio": any(s["codec_type"] == "audio" for s in info["streams"]),
+    }
+
+def probe_layout(path: str) -> dict:
+    # What has to match for clips to be joined by stream copy.
+    info = ffmpeg.probe(path)
+    video = next(s for s in info["streams"] if s["codec_type"] == "video")
+    audio = next((s for s in info["streams"] if s["codec_type"] == "audio"), None)
+    return {
+        "duration": float(info["format"]["duration"]),
+        "video": (video["codec_name"], video["width"], video["height"], video.get("pix_fmt")),
+        "audio": (audio["codec_name"], audio["sample_rate"], audio["channels"]) if audio else None,
+    }
+
+# ---------------------------
+# ffmpeg backend: scale + vstack + audio + duration alignment in one pass
+# ---------------------------
+def stack_videos_ffmpeg(upper_video: str, lower_video: str, output_file: str,
+                        preset: str = COMPOSITOR_PRESET, threads: int = COMPOSITOR_THREADS,
+                        width: int = REEL_WIDTH, lower_info: Optional[dict] = None) -> str:
+    # lower_info ({"duration", "has_audio"}) skips probing when the caller already knows them.
+    settings = PRESETS[preset]
+    upper_info = probe_media(upper_video)
+    lower_info = lower_info or probe_media(lower_video)
+    # Same semantics as clips_array: the reel lasts as long as the longer clip.
+    duration = max(upper_info["duration"], lower_info["duration"])
+
+    inputs = [ffmpeg.input(upper_video), ffmpeg.input(lower_video)]
+    videos = []
+    for stream, info in zip(inputs, [upper_info, lower_info]):
+        video = stream.video.filter("scale", width, -2).filter("format", "yuv420p")
+        padding = duration - info["duration"]
+        if padding > 0:
+            # Hold the last frame of the shorter clip instead of ending early.
+            video = video.filter("tpad", stop_mode="clone", stop_duration=padding)
+        videos.append(video)
+    stacked = ffmpeg.filter(videos, "vstack", inputs=2)
+
+    audios = [stream.audio for stream, info in zip(inputs, [upper_info, lower_info]) if info["has_audio"]]
+    streams = [stacked]
+    if len(audios) == 2:
+        streams.append(ffmpeg.filter(audios, "amix", inputs=2, duration="longest"))
+    elif audios:
+        streams.append(audios[0])
+
+    output_args = {
+        "vcodec": "libx264",
+        "preset": settings["preset"],
+        "crf": settings["crf"],
+        "t": duration,
+        "movflags": "+faststart",  # moov atom up front so playback can start before the download ends
+        "force_key_frames": f"expr:gte(t,n_forced*{KEYFRAME_INTERVAL})",
+    }
+    if len(streams) > 1:
+        output_args["acodec"] = "aac"
+    if threads:
+        output_args["threads"] = threads
+
+    (
+        ffmpeg
+        .output(*streams, output_file, **output_args)
+        .run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+    )
+    return output_file
+
+# ---------------------------
+# MoviePy backend (decodes frames in Python; kept as a fallback)
+# ---------------------------
+def stack_videos_moviepy(upper_video: str, lower_video: str, output_file: str,
+                         preset: str = COMPOSITOR_PRESET, threads: int = COMPOSITOR_THREADS,
+                         width: int = REEL_WIDTH, lower_info: Optional[dict] = None) -> str:
+    from moviepy import VideoFileClip, clips_array # type: ignore
+
+    settings = PRESETS[preset]
+    clip_upper = VideoFileClip(upper_video).resized(width=width)
+    clip_lower = VideoFileClip(lower_video).resized(width=width)
+    final_clip = clips_array([[clip_upper], [clip_lower]])
+    final_clip.write_videofile(
+        output_file,
+        codec="libx264",
+        preset=settings["preset"],
+        threads=threads or None,
+        ffmpeg_params=[
+            "-crf", str(settings["crf"]),
+            "-movflags", "+faststart",
+            "-force_key_frames", f"expr:gte(t,n_forced*{KEYFRAME_INTERVAL})",
+        ],
+        temp_audiofile_path=os.path.dirname(output_file),
+        logger=None,
+    )
+    return output_file
+
+
+BACKENDS = {
+    "ffmpeg": stack_videos_ffmpeg,
+    "moviepy": stack_videos_moviepy,
+}
+
+def stack_videos(upper_video: str, lower_video: str, output_file: str, backend: Optional[str] = None,
+                 lower_info: Optional[dict] = None) -> str:
+    backend = backend or COMPOSITOR_BACKEND
+    try:
+        return BACKENDS[backend](upper_video, lower_video, output_file, lower_info=lower_info)
+    except (ffmpeg.Error, FileNotFoundError) as e:
+        if backend == "moviepy":
+            raise
+        stderr = e.stderr.decode(errors="ignore") if isinstance(e, ffmpeg.Error) and e.stderr else e
+        logger.error(f"{backend} compositor failed, falling back to MoviePy: {stderr}")
+        return stack_videos_moviepy(upper_video, lower_video, output_file)
+
+# ---------------------------
+# Joining scenes into the final reel
+# ---------------------------
+def concat_videos(video_files: List[str], output_file: str,
+                  preset: str = COMPOSITOR_PRESET, threads: int = COMPOSITOR_THREADS) -> str:
+    # Composited scenes share codec settings and start on a keyframe, so they are normally joined
+    # by stream copy (concat demuxer) with no decoding at all. Scenes whose size or audio differ
+    # go through the concat filter instead: one re-encode, padded to the tallest scene.
+    layouts = [probe_layout(path) for path in video_files]
+    if all((layout["video"], layout["audio"]) == (layouts[0]["video"], layouts[0]["audio"]) for layout in layouts):
+        list_file = f"{output_file}.txt"
+        with open(list_file, "w") as f:
+            for path in video_files:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        try:
+            (
+                ffmpeg
+                .input(list_file, f="concat", safe=0)
+                .output(output_file, c="copy", movflags="+faststart")
+                .run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+            )
+        finally:
+            os.remove(list_file)
+        return output_file
+
+    settings = PRESETS[preset]
+    width = max(layout["video"][1] for layout in layouts)
+    height = max(layout["video"][2] for layout in layouts)
+    streams = []
+    for path, layout in zip(video_files, layouts):
+        stream = ffmpeg.input(path)
+        video = (
+            stream.video
+            .filter("pad", width, height, "(ow-iw)/2", "(oh-ih)/2")
+            .filter("setsar", 1)
+            .filter("format", "yuv420p")
+        )
+        if layout["audio"]:
+            audio = stream.audio
+        else:
+            # The concat filter needs audio in every segment; fill with silence.
+            audio = ffmpeg.input("anullsrc=channel_layout=stereo:sample_rate=44100", f="lavfi", t=layout["duration"]).audio
+        streams += [video, audio.filter("aformat", sample_rates=44100, channel_layouts="stereo")]
+    joined = ffmpeg.concat(*streams, v=1, a=1).node
+
+    output_args = {
+        "vcodec": "libx264",
+        "acodec": "aac",
+        "preset": settings["preset"],
+        "crf": settings["crf"],
+        "movflags": "+faststart",
+        "force_key_frames": f"expr:gte(t,n_forced*{KEYFRAME_INTERVAL})",
+    }
+    if threads:
+        output_args["threads"] = threads
+    (
+        ffmpeg
+        .output(joined[0], joined[1], output_file, **output_args)
+        .run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+    )
+    return output_file
@@ -0,0 +1,80 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------
+# Content-addressed file cache with an LRU size limit (narration audio, finished reels)
+# ---------------------------
+class FileCache:
+    def __init__(self, name: str, directory: str, max_bytes: int):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, **params) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def path(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def lookup(self, key: str, ext: str) -> Optional[str]:
+        path = self.path(key, ext)
+        try:
+            os.utime(path)  # bump recency for LRU eviction
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def store(self, key: str, ext: str, write: Callable[[str], None]) -> str:
+        # Write to a temp name and rename, so other workers never see a half-written file.
+        path = self.path(key, ext)
+        tmp_path = os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+        return path
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if name.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    total -= size
+                    logger.info(f"Evicted {name} from {self.name} cache")
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -1,25 +1,31 @@
 import os
+import time
 import uuid
-import base64
 import requests # type: ignore
 import shutil
 import tempfile
 import logging
 from  pydantic import BaseModel # type: ignore
-from typing import List, Optional
+from typing import Callable, List, Optional, Union
 from dotenv import load_dotenv # type: ignore
 
-# MoviePy imports
-from moviepy import * # type: ignore
-
 # ElevenLabs imports
 from elevenlabs.client import ElevenLabs # type: ignore
 from elevenlabs import VoiceSettings # type: ignore
-import ffmpeg # type: ignore
+
+from ml.admission import INTERACTIVE, Priority, admitted
+from ml.audio_stream import NarrationAudio, stream_to_wav
+from ml.compositor import concat_videos, stack_videos
+from ml.hls import HLSPlaylistWriter
+from ml.pipeline import StageGraph
+from ml.render_client import DataUriJsonBody, post_to_file
+from ml.tts_cache import tts_cache
+from ml.workspace import Workspace
 
 # Load environment variables
 load_dotenv('backend/app/.env')
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL") or None  # e.g. a local stand-in for benchmarks
 # (Assume OPENAI_API_KEY is set in your environment for your endpoints if needed)
 
 # Set up logging
@@ -70,72 +76,83 @@ def generate_storyboard(topic: str) -> Storyboard:
 # ---------------------------
 # ElevenLabs TTS (MP3 generation)
 # ---------------------------
-def text_to_speech_file(text: str) -> str:
-    client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-    response = client.text_to_speech.convert(
-        voice_id="9BWtsMINqrJLrRacOk9x",  # Adam's pre-made voice
-        output_format="mp3_22050_32",
+TTS_VOICE_ID = "9BWtsMINqrJLrRacOk9x"  # Adam's pre-made voice
+TTS_MODEL_ID = "eleven_turbo_v2_5"
+TTS_OUTPUT_FORMAT = "mp3_22050_32"
+TTS_VOICE_SETTINGS = VoiceSettings(
+    stability=0.0,
+    similarity_boost=1.0,
+    style=0.0,
+    use_speaker_boost=True,
+)
+
+_elevenlabs_client = None
+
+def get_elevenlabs_client() -> ElevenLabs:
+    global _elevenlabs_client
+    if _elevenlabs_client is None:
+        _elevenlabs_client = ElevenLabs(api_key=ELEVENLABS_API_KEY, base_url=ELEVENLABS_BASE_URL)
+    return _elevenlabs_client
+
+def tts_cache_key(text: str) -> str:
+    return tts_cache.key(
         text=text,
-        model_id="eleven_turbo_v2_5",
-        voice_settings=VoiceSettings(
-            stability=0.0,
-            similarity_boost=1.0,
-            style=0.0,
-            use_speaker_boost=True,
-        ),
+        voice_id=TTS_VOICE_ID,
+        model_id=TTS_MODEL_ID,
+        output_format=TTS_OUTPUT_FORMAT,
+        voice_settings=TTS_VOICE_SETTINGS.model_dump(),
+    )
+
+def convert_text_to_speech(text: str):
+    # Iterator of MP3 chunks as ElevenLabs streams them.
+    return get_elevenlabs_client().text_to_speech.convert(
+        voice_id=TTS_VOICE_ID,
+        output_format=TTS_OUTPUT_FORMAT,
+        text=text,
+        model_id=TTS_MODEL_ID,
+        voice_settings=TTS_VOICE_SETTINGS,
     )
-    mp3_file = f"{uuid.uuid4()}.mp3"
-    with open(mp3_file, "wb") as f:
-        for chunk in response:
-            if chunk:
-                f.write(chunk)
-    logger.info(f"Audio saved to {mp3_file}")
-    return mp3_file
 
 # ---------------------------
-# Convert MP3 to WAV using pydub
+# Narration straight to an in-memory WAV (TTS chunks piped through ffmpeg)
 # ---------------------------
-logger = logging.getLogger(__name__)
+def narration_audio(text: str) -> NarrationAudio:
+    key = tts_cache_key(text)
+    cached = tts_cache.lookup(key, "wav")
+    if cached:
+        logger.info(f"WAV cache hit: {cached}")
+        with open(cached, "rb") as f:
+            return NarrationAudio(f.read())
 
-def convert_mp3_to_wav(mp3_file: str) -> str:
-    wav_file = mp3_file.replace(".mp3", ".wav")
-    
-    try:
-        (
-            ffmpeg
-            .input(mp3_file)
-            .output(wav_file, format='wav', acodec='pcm_s16le')  # Standard WAV format
-            .run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
-        )
-        logger.info(f"Converted {mp3_file} to {wav_file}")
-        return wav_file
-    except ffmpeg.Error as e:
-        logger.error(f"Error converting {mp3_file} to {wav_file}: {e}")
-        return None
+    audio = stream_to_wav(convert_text_to_speech(text))
+
+    def write(path: str):
+        with open(path, "wb") as f:
+            f.write(audio.wav)
+
+    tts_cache.store(key, "wav", write)
+    logger.info(f"Narration rendered in memory ({audio.duration:.1f}s)")
+    return audio
 
 # ---------------------------
 # Generate Avatar Video via Lipsync Endpoint
 # ---------------------------
-def generate_avatar_video(audio_file: str) -> str:
-    # Endpoint URL for avatar video generation (expects a data URI for audio)
-    avatar_url = "https://zolpj03o19vuv8-5000.proxy.runpod.net/predict"
-    with open(audio_file, "rb") as af:
-        audio_data = af.read()
-    audio_base64 = base64.b64encode(audio_data).decode("utf-8")
-    # Use MIME type for wav file.
-    audio_data_uri = f"data:audio/wav;base64,{audio_base64}"
-    payload = {
-        "reference": "https://raw.githubusercontent.com/adarshxs/temp/refs/heads/main/ladki.jpg",
-        "audio": audio_data_uri,
+AVATAR_REFERENCE_URL = os.getenv("AVATAR_REFERENCE_URL", "https://raw.githubusercontent.com/adarshxs/temp/refs/heads/main/ladki.jpg")
+
+def generate_avatar_video(audio: Union[str, bytes], output_dir: str = ".", priority: Priority = INTERACTIVE) -> str:
+    # The endpoint expects the audio as a data URI; it is base64-encoded while uploading.
+    fields = {
+        "reference": AVATAR_REFERENCE_URL,
         "animation_mode": "human"
     }
     logger.info("Calling avatar video endpoint with payload.")
     try:
-        response = requests.post(avatar_url, json=payload, timeout=30)
-        response.raise_for_status()
-        avatar_video_file = f"avatar_{uuid.uuid4()}.mp4"
-        with open(avatar_video_file, "wb") as f:
-            f.write(response.content)
+        with admitted("avatar", priority):
+            avatar_video_file = post_to_file(
+                "avatar",
+                os.path.join(output_dir, f"avatar_{uuid.uuid4()}.mp4"),
+                body=lambda: DataUriJsonBody(fields, "audio", audio, "audio/wav"),  # Use MIME type for wav file.
+            )
         logger.info(f"Avatar video saved as {avatar_video_file}")
         return avatar_video_file
     except requests.exceptions.RequestException as e:
@@ -147,17 +164,12 @@ def generate_avatar_video(audio_file: str) -> str:
 # ---------------------------
 # Generate Manim Video via Endpoint
 # ---------------------------
-def generate_manim_video(topic: str) -> str:
-    # Endpoint URL for Manim video generation
-    manim_url = "https://zolpj03o19vuv8-4000.proxy.runpod.net/generate_manim"
-    payload = {"prompt": f"Create a Manim animation that explains the basics of {topic}."}
+def generate_manim_video(prompt: str, output_dir: str = ".", priority: Priority = INTERACTIVE) -> str:
+    payload = {"prompt": prompt}
     logger.info("Calling Manim generation endpoint.")
     try:
-        response = requests.post(manim_url, json=payload, timeout=300)
-        response.raise_for_status()
-        manim_video_file = f"manim_{uuid.uuid4()}.mp4"
-        with open(manim_video_file, "wb") as f:
-            f.write(response.content)
+        with admitted("manim", priority):
+            manim_video_file = post_to_file("manim", os.path.join(output_dir, f"manim_{uuid.uuid4()}.mp4"), json_payload=payload)
         logger.info(f"Manim video saved as {manim_video_file}")
         return manim_video_file
     except requests.exceptions.RequestException as e:
@@ -167,37 +179,79 @@ def generate_manim_video(topic: str) -> str:
         raise
 
 # ---------------------------
-# Combine Videos Vertically using MoviePy
+# Combine Videos Vertically (single-pass ffmpeg, MoviePy fallback)
+# ---------------------------
+def combine_videos(upper_video: str, lower_video: str, output_file: str, lower_info: Optional[dict] = None) -> str:
+    return stack_videos(upper_video, lower_video, output_file, lower_info=lower_info)
+
+# ---------------------------
+# Concatenate Scene Videos (stream copy when the scenes match)
 # ---------------------------
-def combine_videos(upper_video: str, lower_video: str, output_file: str) -> str:
-    clip_upper = VideoFileClip(upper_video) # type: ignore
-    clip_lower = VideoFileClip(lower_video) # type: ignore
-    # Optionally, resize clips so that their widths match.
-    final_clip = clips_array([[clip_upper], [clip_lower]]) # type: ignore
-    final_clip.write_videofile(output_file, codec="libx264")
-    return output_file
+def concatenate_videos(video_files: List[str], output_file: str) -> str:
+    return concat_videos(video_files, output_file)
 
 # ---------------------------
 # Create Final Reel Pipeline
 # ---------------------------
-def create_final_reel(topic: str) -> str:
+def add_scene_stages(graph: StageGraph, scene: Scene, workspace: Workspace, priority: Priority = INTERACTIVE) -> str:
+    # Manim runs alongside TTS -> avatar; the scene is composited once both are ready.
+    # Narration stays in memory from ElevenLabs through ffmpeg to the avatar upload.
+    tts = graph.add(f"{scene.id}.tts", lambda: narration_audio(scene.narration), backend="tts")
+    avatar = graph.add(f"{scene.id}.avatar", lambda audio: generate_avatar_video(audio.wav, workspace.path, priority), deps=[tts], backend="avatar")
+    manim = graph.add(f"{scene.id}.manim", lambda: generate_manim_video(scene.manim_prompt, workspace.path, priority), backend="manim")
+    return graph.add(
+        f"{scene.id}.combine",
+        # The avatar clip lasts as long as its narration, so its duration is known without probing.
+        lambda manim_video, avatar_video, audio: combine_videos(
+            manim_video, avatar_video, workspace.file(f"scene_{scene.id}.mp4"),
+            lower_info={"duration": audio.duration, "has_audio": True},
+        ),
+        deps=[manim, avatar, tts],
+        backend="encode",
+    )
+
+def create_final_reel(topic: str, progress: Optional[Callable[[str, float], None]] = None,
+                      hls_dir: Optional[str] = None, timing: Optional[Callable[[str, float], None]] = None,
+                      priority: Priority = INTERACTIVE) -> str:
+    # progress(stage, fraction) is called as the reel advances; used by the video job queue.
+    # With hls_dir, each scene is also published as HLS segments as soon as it is composited.
+    # timing(stage, seconds) gets how long each kind of stage took (tts, avatar, manim, combine, ...).
+    # priority orders this reel's GPU render calls against other reels'; a JobPriority can be raised mid-render (see ml.admission).
+    report = progress or (lambda stage, fraction: None)
+    record = timing or (lambda stage, seconds: None)
+
     # 1. Generate storyboard (we use a sample storyboard for now).
+    report("storyboard", 0.0)
+    start = time.perf_counter()
     storyboard = generate_storyboard(topic)
-    # For this pipeline, we use the narration of the first scene.
-    scene = storyboard.scenes[0]
-    logger.info(f"Processing scene: {scene.id}")
-
-    # 2. Generate narration audio.
-    mp3_audio = text_to_speech_file(scene.narration)
-    # 3. Convert MP3 to WAV.
-    wav_audio = convert_mp3_to_wav(mp3_audio)
-    # 4. Generate avatar video using the WAV audio.
-    avatar_video = generate_avatar_video(wav_audio)
-    # 5. Generate Manim animation video via the endpoint.
-    manim_video = generate_manim_video(topic)
-    # 6. Combine the two videos vertically.
-    final_reel = f"final_reel_{uuid.uuid4()}.mp4"
-    combined = combine_videos(manim_video, avatar_video, final_reel)
+    record("storyboard", time.perf_counter() - start)
+
+    # Intermediates live in a scratch workspace (tmpfs when available) that is removed afterwards;
+    # only the final reel is promoted to durable storage.
+    with Workspace() as workspace:
+        # 2. Render every scene; stages run concurrently within and across scenes.
+        graph = StageGraph()
+        scene_stages = [add_scene_stages(graph, scene, workspace, priority) for scene in storyboard.scenes]
+        playlist = HLSPlaylistWriter(hls_dir) if hls_dir else None
+        if playlist is not None:
+            for index, (scene, stage) in enumerate(zip(storyboard.scenes, scene_stages)):
+                graph.add(f"{scene.id}.hls", lambda video, index=index: playlist.add_scene(index, video), deps=[stage], backend="ffmpeg")
+        logger.info(f"Rendering {len(scene_stages)} scenes in {workspace.path}")
+        try:
+            results = graph.run(on_stage_done=lambda name, done, total: report(name, 0.05 + 0.85 * done / total))
+        finally:
+            for name, seconds in graph.timings.items():
+                record(name.rsplit(".", 1)[-1], seconds)
+        if playlist is not None:
+            playlist.finish()
+
+        # 3. Concatenate the scenes, in storyboard order, into one reel.
+        report("concatenate", 0.9)
+        start = time.perf_counter()
+        final_reel = workspace.file(f"final_reel_{uuid.uuid4()}.mp4")
+        concatenate_videos([results[name] for name in scene_stages], final_reel)
+        combined = workspace.promote(final_reel)
+        record("concatenate", time.perf_counter() - start)
     logger.info(f"Final reel generated at: {combined}")
     return combined
 
@@ -0,0 +1,142 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+HLS_ROOT = os.getenv("HLS_ROOT", "hls")
+# Also the playlist's EXT-X-TARGETDURATION, fixed up front since it may not change mid-playlist.
+# The compositor forces keyframes at a divisor of it, so segments come out at this length.
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+PLAYLIST_NAME = "index.m3u8"
+# Segments are only needed while a reel renders (the finished reel is served as one file), so
+# a job's directory is removed once it has gone this long without changes.
+HLS_MAX_AGE = float(os.getenv("HLS_MAX_AGE", str(6 * 3600)))
+HLS_GC_INTERVAL = float(os.getenv("HLS_GC_INTERVAL", "600"))
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------
+# Cut one composited scene into MPEG-TS segments (stream copy, no re-encode)
+# ---------------------------
+def segment_scene(video_file: str, directory: str, prefix: str) -> List[Tuple[float, str]]:
+    # Deferred: the API process imports this module only for HLS_ROOT/PLAYLIST_NAME.
+    import ffmpeg # type: ignore
+
+    scene_playlist = os.path.join(directory, f"{prefix}.m3u8")
+    (
+        ffmpeg
+        .input(video_file)
+        .output(
+            scene_playlist,
+            c="copy",
+            f="hls",
+            hls_time=HLS_SEGMENT_SECONDS,
+            hls_playlist_type="vod",
+            hls_segment_filename=os.path.join(directory, f"{prefix}_%03d.ts"),
+        )
+        .run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+    )
+
+    segments = []
+    with open(scene_playlist) as f:
+        duration = None
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line and not line.startswith("#") and duration is not None:
+                segments.append((duration, os.path.basename(line)))
+                duration = None
+    os.remove(scene_playlist)
+    return segments
+
+# ---------------------------
+# Incrementally published playlist for the whole reel
+# ---------------------------
+class HLSPlaylistWriter:
+    # Scenes can finish in any order; they are published strictly in storyboard order so the
+    # playlist only ever grows at the end, which is what players polling an EVENT playlist expect.
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.playlist = os.path.join(directory, PLAYLIST_NAME)
+        self._ready: Dict[int, List[Tuple[float, str]]] = {}
+        self._segments: List[Tuple[float, str, bool]] = []  # (duration, file, discontinuity before it)
+        self._next_scene = 0
+        self._finished = False
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._write()  # empty playlist so clients can start polling right away
+
+    def add_scene(self, index: int, video_file: str) -> str:
+        segments = segment_scene(video_file, self.directory, f"scene{index}")
+        with self._lock:
+            self._ready[index] = segments
+            while self._next_scene in self._ready:
+                for position, (duration, name) in enumerate(self._ready.pop(self._next_scene)):
+                    # Each scene is encoded separately, so timestamps restart between scenes.
+                    self._segments.append((duration, name, self._next_scene > 0 and position == 0))
+                self._next_scene += 1
+            self._write()
+        logger.info(f"Scene {index} segmented into {len(segments)} HLS segments")
+        return video_file
+
+    def finish(self):
+        with self._lock:
+            self._finished = True
+            self._write()
+
+    def _write(self):
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{HLS_SEGMENT_SECONDS}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+        ]
+        for duration, name, discontinuity in self._segments:
+            if discontinuity:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(name)
+        if self._finished:
+            lines.append("#EXT-X-ENDLIST")
+
+        tmp_path = f"{self.playlist}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.playlist)
+
+# ---------------------------
+# Retention
+# ---------------------------
+def collect_hls(root: str = HLS_ROOT, max_age: float = HLS_MAX_AGE) -> int:
+    # Removes job directories untouched for max_age. Returns how many were removed.
+    if not os.path.isdir(root):
+        return 0
+    now = time.time()
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if not os.path.isdir(path) or now - os.path.getmtime(path) < max_age:
+                continue
+        except OSError:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    if removed:
+        logger.info(f"Removed {removed} expired HLS directories from {root}")
+    return removed
+
+
+async def hls_gc_loop(interval: float = HLS_GC_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, collect_hls)
+        except Exception as e:
+            logger.error(f"HLS GC failed: {e}")
+        await asyncio.sleep(interval)
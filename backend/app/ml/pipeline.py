@@ -0,0 +1,88 @@
+import os
+import logging
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-backend concurrency limits, shared by every graph running in this process.
+# The GPU render endpoints (avatar, manim) are limited across processes by ml.admission instead.
+BACKEND_LIMITS = {
+    "tts": int(os.getenv("TTS_CONCURRENCY", "4")),
+    "ffmpeg": int(os.getenv("FFMPEG_CONCURRENCY", "4")),
+    "encode": int(os.getenv("ENCODE_CONCURRENCY", "2")),
+}
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "8"))
+
+_backend_slots = {name: threading.BoundedSemaphore(limit) for name, limit in BACKEND_LIMITS.items()}
+
+# ---------------------------
+# Stage graph
+# ---------------------------
+class Stage:
+    def __init__(self, name: str, fn: Callable[..., Any], deps: Iterable[str] = (), backend: Optional[str] = None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.backend = backend
+
+
+# Runs each stage as soon as its dependencies finish; a stage is called with its deps' results, in order.
+class StageGraph:
+    def __init__(self, max_workers: int = STAGE_WORKERS):
+        self.max_workers = max_workers
+        self.stages: Dict[str, Stage] = {}
+        self.timings: Dict[str, float] = {}  # stage name -> seconds spent running it, excluding slot waits
+
+    def add(self, name: str, fn: Callable[..., Any], deps: Iterable[str] = (), backend: Optional[str] = None) -> str:
+        deps = list(deps)
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self.stages[name] = Stage(name, fn, deps, backend)
+        return name
+
+    def _timed_call(self, stage: Stage, args: List[Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return stage.fn(*args)
+        finally:
+            self.timings[stage.name] = time.perf_counter() - start
+
+    def _call(self, stage: Stage, args: List[Any]) -> Any:
+        slot = _backend_slots.get(stage.backend)
+        if slot is None:
+            return self._timed_call(stage, args)
+        with slot:
+            return self._timed_call(stage, args)
+
+    def run(self, on_stage_done: Optional[Callable[[str, int, int], None]] = None) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        pending = dict(self.stages)
+        running: Dict[Future, str] = {}
+        total = len(self.stages)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in [n for n, s in pending.items() if all(d in results for d in s.deps)]:
+                    stage = pending.pop(name)
+                    logger.info(f"Starting stage {name}")
+                    running[pool.submit(self._call, stage, [results[d] for d in stage.deps])] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception:
+                        logger.error(f"Stage {name} failed")
+                        for other in running:
+                            other.cancel()
+                        raise
+                    if on_stage_done is not None:
+                        on_stage_done(name, len(results), total)
+        return results
@@ -0,0 +1,72 @@
+# Renders popular topics ahead of time so users get them straight from the reel cache.
+# Submits through the running API, so prewarm jobs share its workers and GPU admission
+# control at batch priority and back off when it sheds load. Run from backend/app:
+#
+#   python -m ml.prewarm --top 20                        # most frequent topic names in Mongo
+#   python -m ml.prewarm --topics "explain NodeJS" "explain Docker"
+import os
+import time
+import asyncio
+import logging
+import argparse
+from typing import List
+
+import requests # type: ignore
+
+PREWARM_API_URL = os.getenv("PREWARM_API_URL", "http://127.0.0.1:8000")
+PREWARM_MAX_WAIT = float(os.getenv("PREWARM_MAX_WAIT", "3600"))  # give up on a topic after this long
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def popular_topics(limit: int) -> List[str]:
+    from db.database import init_db
+    from db.crud import get_popular_topic_names
+
+    await init_db()
+    return await get_popular_topic_names(limit)
+
+
+def submit(api_url: str, topic: str) -> dict:
+    # Retries while the API answers 429/503, honouring its Retry-After.
+    deadline = time.monotonic() + PREWARM_MAX_WAIT
+    while True:
+        response = requests.post(f"{api_url}/videos", json={"topic_prompt": topic, "batch": True}, timeout=30)
+        if response.status_code not in (429, 503) or time.monotonic() > deadline:
+            response.raise_for_status()
+            return response.json()
+        delay = float(response.headers.get("Retry-After", "30"))
+        logger.info(f"API busy ({response.status_code}), retrying {topic!r} in {delay:.0f}s")
+        time.sleep(delay)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topics", nargs="*", default=[], help="topics to render")
+    parser.add_argument("--top", type=int, default=0, help="also render the N most frequent topic names")
+    parser.add_argument("--api", default=PREWARM_API_URL)
+    args = parser.parse_args()
+
+    topics = list(args.topics)
+    if args.top:
+        topics += asyncio.run(popular_topics(args.top))
+    if not topics:
+        parser.error("nothing to prewarm: pass --topics and/or --top")
+
+    counts = {"cached": 0, "queued": 0, "failed": 0}
+    for topic in topics:
+        try:
+            job = submit(args.api, topic)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Could not submit {topic!r}: {e}")
+            counts["failed"] += 1
+            continue
+        status = "cached" if job["status"] == "done" else "queued"
+        counts[status] += 1
+        logger.info(f"{topic!r}: {status} (job {job['job_id']})")
+    logger.info(f"Prewarm submitted {len(topics)} topics: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import os
+
+from ml.file_cache import FileCache
+from utils.keys import request_key
+from utils.metrics import collectors
+
+REEL_CACHE_DIR = os.getenv("REEL_CACHE_DIR", "reel_cache")
+REEL_CACHE_MAX_BYTES = int(os.getenv("REEL_CACHE_MAX_BYTES", str(4 * 1024 ** 3)))
+# Bump when the storyboard template, narration voice or rendering changes, so old reels stop matching.
+REEL_PIPELINE_VERSION = "1"
+
+# Finished reels by topic. The storyboard is deterministic per topic, so the same normalized
+# topic always renders the same reel. This is the only copy: jobs reference their entry and an
+# evicted reel is rendered again when its job is next streamed, so REEL_CACHE_MAX_BYTES bounds reel storage.
+reel_cache = FileCache("reel", REEL_CACHE_DIR, REEL_CACHE_MAX_BYTES)
+collectors.append(lambda: [
+    ("reel_cache_lookups_total", "counter", "Reel cache lookups on submission and streaming", {"result": result}, count)
+    for result, count in (("hit", reel_cache.hits), ("miss", reel_cache.misses))
+])
+
+
+def reel_key(topic_prompt: str) -> str:
+    return request_key(topic=topic_prompt, version=REEL_PIPELINE_VERSION)
+
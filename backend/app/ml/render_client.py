@@ -0,0 +1,118 @@
+import os
+import io
+import json
+import time
+import base64
+import random
+import logging
+import requests # type: ignore
+from requests.adapters import HTTPAdapter # type: ignore
+from typing import Callable, Optional, Union
+
+# Render backends. Override the URLs to point the pipeline at a local stand-in server.
+ENDPOINTS = {
+    "avatar": {
+        "url": os.getenv("AVATAR_URL", "https://zolpj03o19vuv8-5000.proxy.runpod.net/predict"),
+        "timeout": (float(os.getenv("AVATAR_CONNECT_TIMEOUT", "10")), float(os.getenv("AVATAR_READ_TIMEOUT", "30"))),
+    },
+    "manim": {
+        "url": os.getenv("MANIM_URL", "https://zolpj03o19vuv8-4000.proxy.runpod.net/generate_manim"),
+        "timeout": (float(os.getenv("MANIM_CONNECT_TIMEOUT", "10")), float(os.getenv("MANIM_READ_TIMEOUT", "300"))),
+    },
+}
+RENDER_MAX_RETRIES = int(os.getenv("RENDER_MAX_RETRIES", "2"))
+RENDER_BACKOFF = float(os.getenv("RENDER_BACKOFF", "2"))
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", "8"))
+RETRY_STATUSES = {502, 503, 504}
+CHUNK_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+_session: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    # Keep-alive connections shared by every render call in this process.
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(ENDPOINTS), pool_maxsize=RENDER_POOL_SIZE)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+# ---------------------------
+# Streaming JSON body with a base64 data URI field
+# ---------------------------
+class DataUriJsonBody:
+    # Serializes {**fields, field: "data:<mime>;base64,<file>"} while reading the file in chunks,
+    # so peak memory stays flat however large the file is. `source` is a path or in-memory bytes.
+    # requests reads it like a file and takes Content-Length from `len` (no tell/seek on purpose,
+    # or requests would size it as 0).
+    def __init__(self, fields: dict, field: str, source: Union[str, bytes], mime: str):
+        head = json.dumps(fields)[:-1] + (", " if fields else "") + json.dumps(field) + ": \""
+        self._head = (head + f"data:{mime};base64,").encode("utf-8")
+        self._tail = b"\"}"
+        if isinstance(source, bytes):
+            self._file = io.BytesIO(source)
+            size = len(source)
+        else:
+            self._file = open(source, "rb")
+            size = os.fstat(self._file.fileno()).st_size
+        self.len = len(self._head) + 4 * ((size + 2) // 3) + len(self._tail)
+        self._pending = self._head
+        self._done = False
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.len
+        while len(self._pending) < size and not self._done:
+            raw = self._file.read(3 * 64 * 1024)  # multiple of 3 so chunks encode without padding
+            if raw:
+                self._pending += base64.b64encode(raw)
+            else:
+                self._pending += self._tail
+                self._done = True
+        out, self._pending = self._pending[:size], self._pending[size:]
+        return out
+
+    def close(self):
+        self._file.close()
+
+# ---------------------------
+# POST and stream the response to disk, with retry/backoff
+# ---------------------------
+def post_to_file(endpoint: str, output_file: str, json_payload: Optional[dict] = None,
+                 body: Optional[Callable[[], DataUriJsonBody]] = None) -> str:
+    # `body` is a factory so each retry gets a fresh stream.
+    config = ENDPOINTS[endpoint]
+    for attempt in range(RENDER_MAX_RETRIES + 1):
+        data = body() if body is not None else None
+        try:
+            headers = {"Content-Type": "application/json"} if data is not None else None
+            with get_session().post(config["url"], json=json_payload, data=data, headers=headers,
+                                    timeout=config["timeout"], stream=True) as response:
+                if response.status_code in RETRY_STATUSES and attempt < RENDER_MAX_RETRIES:
+                    raise requests.exceptions.RetryError(f"{endpoint} returned {response.status_code}")
+                if not response.ok:
+                    _ = response.content  # buffer the error body so callers can still log it
+                    response.raise_for_status()
+                tmp_file = f"{output_file}.part"
+                try:
+                    with open(tmp_file, "wb") as f:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            f.write(chunk)
+                    os.replace(tmp_file, output_file)
+                finally:
+                    if os.path.exists(tmp_file):
+                        os.remove(tmp_file)
+                return output_file
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.RetryError) as e:
+            if attempt == RENDER_MAX_RETRIES:
+                raise
+            delay = RENDER_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.warning(f"{endpoint} request failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+        finally:
+            if data is not None:
+                data.close()
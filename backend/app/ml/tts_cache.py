@@ -0,0 +1,9 @@
+import os
+
+from ml.file_cache import FileCache
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Narration cache, MP3 + WAV side by side.
+tts_cache = FileCache("TTS", TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
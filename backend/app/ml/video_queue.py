@@ -0,0 +1,490 @@
+import os
+import math
+import uuid
+import fcntl
+import pickle
+import shutil
+import socket
+import tempfile
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.managers import SyncManager
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from db.crud import (
+    claim_video_job, count_queued_video_jobs, create_video_job, find_unfinished_video_job, get_claimable_video_jobs,
+    get_promoted_video_jobs, release_video_job_leases, renew_video_job_leases, requeue_video_job, update_video_job,
+    update_video_job_progress,
+)
+from ml.admission import ADMISSION_BACKENDS, INTERACTIVE, AdmissionController, CircuitOpenError, JobPriority
+from ml.hls import HLS_ROOT
+from ml.reel_cache import reel_cache, reel_key
+from utils.keys import request_key
+from utils.metrics import Counter, Histogram
+from utils.singleflight import SingleFlight
+
+# Max number of reels rendered at the same time (one worker process each).
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "2"))
+# Reels waiting for a worker before new submissions are refused with a 429. Batch (prewarm)
+# submissions stop earlier so there is always room left for users.
+VIDEO_MAX_QUEUED = int(os.getenv("VIDEO_MAX_QUEUED", "20"))
+VIDEO_MAX_QUEUED_BATCH = int(os.getenv("VIDEO_MAX_QUEUED_BATCH", "10"))
+# A worker renews the leases on its jobs every third of this; jobs whose lease lapsed (their
+# worker died or was stopped) are taken over by whichever API worker claims them first.
+VIDEO_LEASE_SECONDS = float(os.getenv("VIDEO_LEASE_SECONDS", "60"))
+# Only the API worker holding this lock renders, so the GPU admission limits and the worker pool
+# exist once per host however many uvicorn workers run. The others create jobs in Mongo and the
+# renderer claims them; if it exits, another worker takes the lock over. Limits are per host:
+# run the API on one host, or give each host its own share of the GPU backends.
+VIDEO_RENDER_LOCK = os.getenv("VIDEO_RENDER_LOCK", os.path.join(tempfile.gettempdir(), "tldreel-render.lock"))
+VIDEO_CLAIM_INTERVAL = float(os.getenv("VIDEO_CLAIM_INTERVAL", "2"))  # seconds between looks for jobs to claim
+# Times a job is retried when its render worker dies (OOM kill, crash) and takes the pool down.
+VIDEO_POOL_RETRIES = int(os.getenv("VIDEO_POOL_RETRIES", "1"))
+
+logger = logging.getLogger(__name__)
+
+VIDEO_STAGE_LATENCY = Histogram("video_stage_seconds", "Time spent in each reel rendering stage", labels=["stage"])
+VIDEO_JOB_LATENCY = Histogram("video_job_seconds", "Time from dispatch to a finished or failed reel", labels=["outcome"])
+TTS_CACHE_LOOKUPS = Counter("tts_cache_lookups_total", "Narration cache lookups in render workers", labels=["result"])
+VIDEO_SHED = Counter("video_jobs_shed_total", "Reel submissions refused because of load or a failing backend", labels=["reason"])
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many reels queued, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+# The GPU admission controllers live in the manager process so every render worker shares them.
+class RenderManager(SyncManager):
+    pass
+
+
+RenderManager.register("AdmissionController", AdmissionController)
+
+# ---------------------------
+# Worker process entry point
+# ---------------------------
+def _portable_error(e: Exception) -> Exception:
+    # Errors go back to the API process pickled. One that can't be unpickled (ffmpeg.Error needs
+    # extra constructor arguments) breaks the whole pool, so it is replaced by a RuntimeError.
+    try:
+        pickle.loads(pickle.dumps(e))
+        return e
+    except Exception:
+        stderr = getattr(e, "stderr", None)
+        detail = f": {stderr.decode(errors='ignore').strip()[-2000:]}" if isinstance(stderr, bytes) and stderr else ""
+        return RuntimeError(f"{type(e).__name__}: {e}{detail}")
+
+
+def _render_job(*args) -> str:
+    try:
+        return _render_reel(*args)
+    except Exception as e:
+        portable = _portable_error(e)
+        if portable is e:
+            raise
+        raise portable from None
+
+
+def _render_reel(job_id: str, topic_prompt: str, segmented: bool, priority: int, progress_queue, controllers, priorities) -> str:
+    # Imported here so MoviePy/ElevenLabs/ffmpeg only load in worker processes, never in the API.
+    # Progress and timings go back to the API process over the queue, which owns the metrics.
+    from ml.admission import install
+    from ml.generate_video import create_final_reel
+    from ml.tts_cache import tts_cache
+
+    install(controllers, report=lambda backend, snapshot: progress_queue.put(("admission", backend, snapshot)))
+    # A resumed job, or one that raced another worker, may already have its reel.
+    key = reel_key(topic_prompt)
+    cached = reel_cache.lookup(key, "mp4")
+    if cached is not None:
+        return cached
+
+    def report(stage: str, progress: float):
+        progress_queue.put(("progress", job_id, stage, progress))
+
+    def timing(stage: str, seconds: float):
+        progress_queue.put(("timing", stage, seconds))
+
+    priority = JobPriority(job_id, priority, priorities)  # the queue raises it if a user joins this job
+    before = tts_cache.stats()
+    hls_dir = os.path.join(HLS_ROOT, job_id) if segmented else None
+    try:
+        video = create_final_reel(topic_prompt, progress=report, hls_dir=hls_dir, timing=timing, priority=priority)
+        return reel_cache.store(key, "mp4", lambda path: shutil.move(video, path))
+    finally:
+        after = tts_cache.stats()
+        progress_queue.put(("tts_cache", after["hits"] - before["hits"], after["misses"] - before["misses"]))
+
+# ---------------------------
+# Render slots handed out by priority
+# ---------------------------
+class PrioritySlots:
+    # The process pool runs jobs in submission order, so jobs wait here for a free worker
+    # instead: lowest priority value first, FIFO within a priority.
+    def __init__(self, size: int):
+        self.free = size
+        self._waiters: list = []
+        self._entries: Dict[str, list] = {}  # key -> its waiter entry, for promote()
+        self._order = itertools.count()
+
+    async def acquire(self, priority: int, key: Optional[str] = None):
+        if self.free > 0 and not self._waiters:
+            self.free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._order), future]  # a list so promote() can change it in place
+        heapq.heappush(self._waiters, entry)
+        if key is not None:
+            self._entries[key] = entry
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # the slot was handed over just as we were cancelled
+            raise
+        finally:
+            self._entries.pop(key, None)
+
+    def promote(self, key: str, priority: int):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > priority and not entry[2].done():
+            entry[0] = priority
+            heapq.heapify(self._waiters)
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():  # skip waiters that were cancelled
+                future.set_result(None)
+                return
+        self.free += 1
+
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+# ---------------------------
+# Job queue (lives in the API process)
+# ---------------------------
+class VideoJobQueue:
+    def __init__(self, max_workers: int = VIDEO_WORKERS):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._progress = None
+        self._priorities = None  # manager dict: job id -> priority, for jobs promoted while queued or rendering
+        self._promoted: set = set()
+        self._controllers: Dict[str, AdmissionController] = {}  # manager proxies
+        self._admission: Dict[str, tuple] = {}  # backend -> (last reported snapshot, monotonic time received)
+        self._slots = PrioritySlots(max_workers)
+        self._job_seconds = 60.0  # moving average of render time, for Retry-After
+        self._drain_task: Optional[asyncio.Task] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._active: Dict[str, object] = {}  # prompt_key -> job still queued or rendering here
+        self._submissions = SingleFlight("videos")
+        self.attached = 0  # duplicate submissions attached to an existing job
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"  # lease holder name
+        self._lease_task: Optional[asyncio.Task] = None
+        self._lock_file = None
+        self._renewed_at = 0.0
+        self.renderer = False  # holds VIDEO_RENDER_LOCK
+
+    async def start(self):
+        if self._take_render_lock():
+            await self._start_rendering()
+        else:
+            logger.info("Another API worker renders reels; this one only queues them")
+        self._lease_task = asyncio.create_task(self._lease_loop())
+
+    def _take_render_lock(self) -> bool:
+        lock_file = open(VIDEO_RENDER_LOCK, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file  # the lock lasts as long as the file stays open
+        return True
+
+    async def _start_rendering(self):
+        # Spawn instead of fork: the API process already runs an event loop and Mongo client threads.
+        self.renderer = True
+        ctx = multiprocessing.get_context("spawn")
+        self._executor = self._new_executor()
+        self._manager = RenderManager(ctx=ctx)
+        self._manager.start()
+        self._progress = self._manager.Queue()
+        self._priorities = self._manager.dict()
+        self._controllers = {
+            backend: self._manager.AdmissionController(backend, initial_limit, max_limit)
+            for backend, (initial_limit, max_limit) in ADMISSION_BACKENDS.items()
+        }
+        # Proxy calls block, so the event loop only ever reads the state the workers report.
+        loop = asyncio.get_running_loop()
+        for backend, controller in self._controllers.items():
+            self._admission[backend] = (await loop.run_in_executor(None, controller.snapshot), time.monotonic())
+        self._drain_task = asyncio.create_task(self._drain_progress())
+
+        # Re-queue anything that was waiting or mid-render when its worker stopped.
+        await self._resume()
+
+    def _lease_until(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=VIDEO_LEASE_SECONDS)
+
+    async def _resume(self):
+        for job in await get_claimable_video_jobs():
+            if str(job.id) in self._tasks:
+                continue
+            claimed = await claim_video_job(str(job.id), self.owner, self._lease_until())
+            if claimed is not None:
+                logger.info(f"Resuming video job {job.id}")
+                self._dispatch(claimed)
+
+    async def _lease_loop(self):
+        # The renderer keeps its jobs leased, claims jobs other API workers queued or whose worker
+        # stopped renewing, and picks up promotions made there. The other workers wait for the lock.
+        while True:
+            await asyncio.sleep(VIDEO_CLAIM_INTERVAL)
+            try:
+                if not self.renderer:
+                    if not self._take_render_lock():
+                        continue
+                    logger.info("Took over reel rendering")
+                    await self._start_rendering()
+                if self._tasks and time.monotonic() - self._renewed_at >= VIDEO_LEASE_SECONDS / 3:
+                    await renew_video_job_leases(self.owner, list(self._tasks), self._lease_until())
+                    self._renewed_at = time.monotonic()
+                await self._resume()
+                waiting = [str(job.id) for job in self._active.values() if job.priority > INTERACTIVE]
+                if waiting:
+                    for promoted in await get_promoted_video_jobs(waiting, INTERACTIVE):
+                        await self._promote(promoted, promoted.priority)
+            except Exception as e:
+                logger.error(f"Could not claim or renew video jobs: {e}")
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_executor(self, broken: ProcessPoolExecutor):
+        # Every job sharing a broken pool fails at once; only the first one to notice rebuilds it.
+        if self._executor is broken:
+            logger.warning("Render worker pool broke, starting a new one")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+
+    async def _render(self, job) -> str:
+        loop = asyncio.get_running_loop()
+        for attempt in range(VIDEO_POOL_RETRIES + 1):
+            executor = self._executor
+            try:
+                return await loop.run_in_executor(
+                    executor, _render_job, str(job.id), job.topic_prompt, job.segmented, job.priority,
+                    self._progress, self._controllers, self._priorities,
+                )
+            except BrokenProcessPool:
+                self._replace_executor(executor)
+                if attempt == VIDEO_POOL_RETRIES:
+                    raise
+                logger.warning(f"Render worker died during video job {job.id}, retrying")
+
+    async def shutdown(self):
+        if self._lease_task is not None:
+            self._lease_task.cancel()
+        for task in self._tasks.values():
+            task.cancel()
+        try:
+            await release_video_job_leases(self.owner)
+        except Exception as e:
+            logger.error(f"Could not release video job leases: {e}")
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._progress is not None:
+            self._progress.put(None)
+        if self._drain_task is not None:
+            await asyncio.gather(self._drain_task, return_exceptions=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    async def submit(self, topic_prompt: str, segmented: bool = False, priority: int = INTERACTIVE):
+        # The same reel requested again while it's still rendering joins the existing job.
+        # Raises QueueFullError or CircuitOpenError instead of queueing work that can't finish in time.
+        prompt_key = request_key(topic_prompt=topic_prompt, segmented=segmented)
+        cached = reel_cache.lookup(reel_key(topic_prompt), "mp4")
+        if cached is not None:
+            # Already rendered: the job is born finished, with no HLS since there is nothing to wait for.
+            return await create_video_job(topic_prompt, prompt_key, priority=priority,
+                                          status="done", stage="done", progress=1.0, video_path=cached)
+        job = self._active.get(prompt_key)
+        if job is not None:
+            self.attached += 1
+        else:
+            job = await self._submissions.do(prompt_key, lambda: self._create(topic_prompt, prompt_key, segmented, priority))
+        await self._promote(job, priority)
+        return job
+
+    async def requeue(self, job):
+        # The job's reel was evicted from the reel cache: render it again under the same job.
+        job = await requeue_video_job(str(job.id))
+        if job is None or not self.renderer:
+            return  # requeued by another request, or left for the renderer to claim
+        claimed = await claim_video_job(str(job.id), self.owner, self._lease_until())
+        if claimed is not None:
+            logger.info(f"Re-rendering evicted reel for video job {job.id}")
+            self._dispatch(claimed)
+
+    async def _create(self, topic_prompt: str, prompt_key: str, segmented: bool, priority: int):
+        # Another API worker may already be rendering it.
+        job = await find_unfinished_video_job(prompt_key)
+        if job is not None:
+            self.attached += 1
+            return job
+        await self._admit(priority)
+        if not self.renderer:
+            return await create_video_job(topic_prompt, prompt_key, segmented, priority)  # the renderer claims it
+        job = await create_video_job(topic_prompt, prompt_key, segmented, priority, owner=self.owner, lease_until=self._lease_until())
+        self._dispatch(job)
+        return job
+
+    def _admission_state(self) -> Dict[str, dict]:
+        # The last reported snapshots, aged locally so an open breaker's cooldown still runs out
+        # when no worker has touched the backend since.
+        now = time.monotonic()
+        state = {}
+        for backend, (snapshot, received) in self._admission.items():
+            snapshot = dict(snapshot)
+            if snapshot["state"] == "open":
+                snapshot["retry_after"] = max(0.0, snapshot["retry_after"] - (now - received))
+                if snapshot["retry_after"] == 0:
+                    snapshot["state"] = "half_open"
+            state[backend] = snapshot
+        return state
+
+    async def _admit(self, priority: int):
+        # Only the renderer sees breaker state; the other workers shed on the queue length in Mongo.
+        for backend, snapshot in self._admission_state().items():
+            if snapshot["state"] == "open":
+                VIDEO_SHED.inc("circuit_open")
+                raise CircuitOpenError(backend, snapshot["retry_after"])
+        limit = VIDEO_MAX_QUEUED if priority == INTERACTIVE else VIDEO_MAX_QUEUED_BATCH
+        waiting = self._slots.waiting() if self.renderer else await count_queued_video_jobs()
+        if waiting >= limit:
+            VIDEO_SHED.inc("queue_full")
+            raise QueueFullError(self._job_seconds * math.ceil((waiting + 1) / self.max_workers))
+
+    async def _promote(self, job, priority: int):
+        # A user joined a prewarm job: it moves up the render queue and, through the shared
+        # priorities, the GPU admission queues its worker waits in. In a worker that doesn't render
+        # only the new priority is recorded; the renderer's lease loop applies it from there.
+        job = self._active.get(job.prompt_key, job)
+        if priority >= job.priority:
+            return
+        job_id = str(job.id)
+        job.priority = priority
+        if job_id in self._tasks:
+            self._slots.promote(job_id, priority)
+            self._promoted.add(job_id)
+            await asyncio.get_running_loop().run_in_executor(None, self._promote_remote, job_id, priority)
+        await update_video_job(job_id, priority=priority)
+
+    def _promote_remote(self, job_id: str, priority: int):
+        self._priorities[job_id] = priority
+        for controller in self._controllers.values():
+            controller.promote(job_id, priority)
+
+    def _dispatch(self, job):
+        job_id = str(job.id)
+        if job.prompt_key:
+            self._active[job.prompt_key] = job
+        self._tasks[job_id] = asyncio.create_task(self._run(job))
+
+    async def _run(self, job):
+        # Reads job.priority when it's needed, since _promote may raise it while the job waits.
+        job_id = str(job.id)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        await self._slots.acquire(job.priority, job_id)
+        try:
+            render_start = time.perf_counter()
+            video_path = await self._render(job)
+            self._job_seconds += 0.2 * (time.perf_counter() - render_start - self._job_seconds)
+            VIDEO_JOB_LATENCY.observe(time.perf_counter() - start, "done")
+            await update_video_job(job_id, status="done", stage="done", progress=1.0, video_path=video_path)
+            logger.info(f"Video job {job_id} finished: {video_path}")
+        except asyncio.CancelledError:
+            # Left as queued/running in Mongo so the next start picks it up again.
+            raise
+        except Exception as e:
+            VIDEO_JOB_LATENCY.observe(time.perf_counter() - start, "error")
+            logger.error(f"Video job {job_id} failed: {e}")
+            await update_video_job(job_id, status="error", error=str(e))
+        finally:
+            self._slots.release()
+            self._tasks.pop(job_id, None)
+            self._active.pop(job.prompt_key, None)
+            if job_id in self._promoted:
+                self._promoted.discard(job_id)
+                try:
+                    await loop.run_in_executor(None, self._priorities.pop, job_id, None)
+                except Exception as e:
+                    logger.warning(f"Could not clear the priority of video job {job_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._active),
+            "waiting": self._slots.waiting(),
+            "attached": self.attached + self._submissions.coalesced,
+            "admission": self._admission_state(),
+        }
+
+    def samples(self):
+        stats = self.stats()
+        yield ("video_renderer", "gauge", "1 in the API worker that renders reels", {}, int(self.renderer))
+        yield ("video_jobs_active", "gauge", "Reels queued or rendering in this API worker", {}, stats["active"])
+        yield ("video_jobs_waiting", "gauge", "Reels waiting for a render worker", {}, stats["waiting"])
+        yield ("video_jobs_attached_total", "counter", "Duplicate reel requests attached to an existing job", {}, stats["attached"])
+        for field, kind, help in (
+            ("limit", "gauge", "Adaptive concurrency limit for a GPU render backend"),
+            ("in_flight", "gauge", "Render calls in flight"),
+            ("queued", "gauge", "Render calls waiting for admission"),
+            ("error_rate", "gauge", "Moving average of failed render calls"),
+            ("admitted", "counter", "Render calls admitted"),
+            ("rejected", "counter", "Render calls rejected by the circuit breaker or a queue timeout"),
+        ):
+            name = f"admission_{field}_total" if kind == "counter" else f"admission_{field}"
+            for backend, snapshot in stats["admission"].items():
+                yield (name, kind, help, {"backend": backend}, snapshot[field])
+        for backend, snapshot in stats["admission"].items():
+            yield ("admission_circuit_open", "gauge", "1 while the backend's circuit breaker is open", {"backend": backend}, int(snapshot["state"] == "open"))
+
+    async def _drain_progress(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self._progress.get)
+            if message is None:
+                return
+            kind, *fields = message
+            if kind == "timing":
+                VIDEO_STAGE_LATENCY.observe(fields[1], fields[0])
+                continue
+            if kind == "admission":
+                self._admission[fields[0]] = (fields[1], time.monotonic())
+                continue
+            if kind == "tts_cache":
+                TTS_CACHE_LOOKUPS.inc("hit", amount=fields[0])
+                TTS_CACHE_LOOKUPS.inc("miss", amount=fields[1])
+                continue
+            job_id, stage, progress = fields
+            try:
+                await update_video_job_progress(job_id, stage, progress)
+            except Exception as e:
+                logger.error(f"Could not record progress for video job {job_id}: {e}")
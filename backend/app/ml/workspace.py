@@ -0,0 +1,132 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+import tempfile
+from typing import Optional
+from utils.metrics import collectors
+
+
+# Free space /dev/shm needs before it is used for scratch: clips, composited scenes and the final
+# reel of every concurrent render are written there. Docker's default of 64 MiB is far too small.
+SCRATCH_TMPFS_MIN_BYTES = int(os.getenv("SCRATCH_TMPFS_MIN_BYTES", str(2 * 1024 ** 3)))
+
+
+def _default_scratch_root() -> str:
+    # Prefer RAM-backed tmpfs for intermediates when the host has one with enough room.
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        stat = os.statvfs("/dev/shm")
+        if stat.f_bavail * stat.f_frsize >= SCRATCH_TMPFS_MIN_BYTES:
+            return "/dev/shm/tldreel-scratch"
+    return os.path.join(tempfile.gettempdir(), "tldreel-scratch")
+
+
+SCRATCH_ROOT = os.getenv("SCRATCH_ROOT") or _default_scratch_root()
+REEL_OUTPUT_DIR = os.getenv("REEL_OUTPUT_DIR", "reels")  # durable storage for finished reels
+SCRATCH_MAX_AGE = float(os.getenv("SCRATCH_MAX_AGE", str(6 * 3600)))
+SCRATCH_QUOTA_BYTES = int(os.getenv("SCRATCH_QUOTA_BYTES", str(2 * 1024 ** 3)))
+SCRATCH_GC_INTERVAL = float(os.getenv("SCRATCH_GC_INTERVAL", "300"))
+LOCK_NAME = ".owner"
+
+logger = logging.getLogger(__name__)
+gc_stats = {"runs": 0, "bytes_reclaimed": 0, "workspaces_removed": 0}
+collectors.append(lambda: [
+    (f"scratch_gc_{name}_total", "counter", "Scratch workspace garbage collection", {}, value) for name, value in gc_stats.items()
+])
+
+# ---------------------------
+# Per-job scratch directory
+# ---------------------------
+class Workspace:
+    def __init__(self, name: Optional[str] = None, root: str = SCRATCH_ROOT):
+        self.path = os.path.join(root, name or uuid.uuid4().hex)
+        os.makedirs(self.path, exist_ok=True)
+        # Marks the workspace as in use by a live process so GC leaves it alone.
+        with open(os.path.join(self.path, LOCK_NAME), "w") as f:
+            f.write(str(os.getpid()))
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def promote(self, path: str, output_dir: str = REEL_OUTPUT_DIR) -> str:
+        # Only finished artifacts leave scratch; rename when on the same filesystem, copy otherwise.
+        os.makedirs(output_dir, exist_ok=True)
+        destination = os.path.join(output_dir, os.path.basename(path))
+        shutil.move(path, destination)
+        return destination
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+# ---------------------------
+# Garbage collection of abandoned workspaces (crashed or killed workers)
+# ---------------------------
+def _owner_alive(path: str) -> bool:
+    try:
+        with open(os.path.join(path, LOCK_NAME)) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def collect_garbage(root: str = SCRATCH_ROOT, max_age: float = SCRATCH_MAX_AGE,
+                    quota_bytes: int = SCRATCH_QUOTA_BYTES) -> int:
+    # Removes workspaces older than max_age, then the oldest ones until the root fits in the quota.
+    # Workspaces whose owning process is still alive are never removed. Returns bytes reclaimed.
+    if not os.path.isdir(root):
+        return 0
+    now = time.time()
+    workspaces = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            workspaces.append((os.path.getmtime(path), _dir_size(path), path))
+
+    total = sum(size for _, size, _ in workspaces)
+    reclaimed = 0
+    for mtime, size, path in sorted(workspaces):
+        if now - mtime < max_age and total <= quota_bytes:
+            break
+        if _owner_alive(path):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        reclaimed += size
+        gc_stats["workspaces_removed"] += 1
+
+    gc_stats["runs"] += 1
+    gc_stats["bytes_reclaimed"] += reclaimed
+    if reclaimed:
+        logger.info(f"Scratch GC reclaimed {reclaimed} bytes from {root}")
+    return reclaimed
+
+
+async def scratch_gc_loop(interval: float = SCRATCH_GC_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, collect_garbage)
+        except Exception as e:
+            logger.error(f"Scratch GC failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,37 @@
+import os
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+
+def file_etag(stat: os.stat_result) -> str:
+    return '"' + hashlib.md5(f"{stat.st_mtime_ns}-{stat.st_size}".encode(), usedforsecurity=False).hexdigest() + '"'
+
+
+def _not_modified(request: Request, etag: str, stat: os.stat_result) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def serve_file(request: Request, path: str, media_type: str, max_age: int = 3600) -> Response:
+    # FileResponse handles Range/If-Range (206 and multipart ranges). The body is read in 64 KiB
+    # chunks in a worker thread and sent through the ASGI server; there is no sendfile path here.
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat.st_mtime, usegmt=True),
+        "cache-control": f"public, max-age={max_age}",
+    }
+    if _not_modified(request, etag, stat):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
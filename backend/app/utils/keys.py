@@ -0,0 +1,17 @@
+import json
+import hashlib
+from typing import Any
+
+
+def normalize(value: Any) -> Any:
+    # Case, surrounding/repeated whitespace and list order don't change what a request asks for.
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, (list, tuple)):
+        return sorted(normalize(v) for v in value)
+    return value
+
+
+def request_key(**parts: Any) -> str:
+    payload = json.dumps({name: normalize(value) for name, value in parts.items()}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,205 @@
+import os
+import time
+import bisect
+import functools
+import threading
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds, from a Mongo point read up to a full reel render.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"  # add a Server-Timing header to every response
+
+# Every metric registers here. Collectors report existing stats dicts at scrape time,
+# as (name, type, help, labels, value) samples.
+metrics: Dict[str, "Metric"] = {}
+collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+# Per-request span totals, only set while a request with Server-Timing enabled is being handled.
+_request_timings: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("request_timings", default=None)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+# ---------------------------
+# Metric types (Prometheus text format)
+# ---------------------------
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        metrics[name] = self
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [per-bucket counts, sum, count]
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels: str) -> "Span":
+        return Span(self, labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+# ---------------------------
+# Spans
+# ---------------------------
+class Span:
+    # `with histogram.time("label"):` observes the elapsed time and, while Server-Timing
+    # is enabled, adds it to the current request's entry for that histogram.
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.histogram.observe(elapsed, *self.labels)
+        timings = _request_timings.get()
+        if timings is not None:
+            entry = timings.setdefault(self.histogram.name, [0.0, 0])
+            entry[0] += elapsed
+            entry[1] += 1
+
+
+def timed(histogram: Histogram, *labels: str):
+    # Decorator for coroutine functions; defaults the label to the function name.
+    def decorator(fn):
+        span_labels = labels or (fn.__name__,)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with Span(histogram, span_labels):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_request_timing() -> Dict[str, List[float]]:
+    timings: Dict[str, List[float]] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, List[float]], total: float) -> str:
+    entries = [f'{name};dur={seconds * 1000:.1f};desc="{count} calls"' for name, (seconds, count) in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+class TimingMiddleware:
+    # Pure ASGI middleware: it only wraps `send`, so response bodies (reel files, SSE) pass straight
+    # through. Observes the time to the response start, labelled by route template and status,
+    # and adds the Server-Timing header when enabled.
+    def __init__(self, app, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        timings = start_request_timing() if SERVER_TIMING else None
+        started = False
+
+        def observe(status: int) -> float:
+            elapsed = time.perf_counter() - start
+            # The route template keeps the label set small (/videos/{job_id}, not every job id).
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.histogram.observe(elapsed, scope["method"], route, str(status))
+            return elapsed
+
+        async def timed_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                elapsed = observe(message["status"])
+                if timings is not None:
+                    header = (b"server-timing", server_timing_header(timings, elapsed).encode("latin-1"))
+                    message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        except Exception:
+            if not started:
+                observe(500)
+            raise
+
+# ---------------------------
+# Exposition
+# ---------------------------
+def render() -> str:
+    lines: List[str] = []
+    for metric in list(metrics.values()):
+        lines.extend(metric.render())
+    seen = set()
+    for collect in collectors:
+        for name, kind, help, labels, value in collect():
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return "\n".join(lines) + "\n"
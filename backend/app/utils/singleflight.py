@@ -0,0 +1,46 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+from utils.metrics import collectors
+
+# Every SingleFlight registers here so its counters can be reported in one place.
+flights: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution of fn and all get its result (or error).
+    def __init__(self, name: str):
+        self.name = name
+        self.executed = 0  # upstream calls actually made
+        self.coalesced = 0  # calls that piggybacked on one already in flight
+        self._tasks: Dict[str, asyncio.Task] = {}
+        flights[name] = self
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            self.executed += 1
+            # Run as its own task so a cancelled caller doesn't cancel the work for everyone else.
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._tasks)}
+
+
+def flight_stats() -> dict:
+    return {name: flight.stats() for name, flight in flights.items()}
+
+
+def _samples():
+    for name, flight in flights.items():
+        yield ("singleflight_calls_total", "counter", "Calls that ran upstream or joined one in flight", {"flight": name, "result": "executed"}, flight.executed)
+        yield ("singleflight_calls_total", "counter", "Calls that ran upstream or joined one in flight", {"flight": name, "result": "coalesced"}, flight.coalesced)
+    for name, flight in flights.items():
+        yield ("singleflight_in_flight", "gauge", "Upstream calls currently in flight", {"flight": name}, len(flight._tasks))
+
+
+collectors.append(_samples)